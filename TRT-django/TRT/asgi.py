@@ -13,4 +13,45 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TRT.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after the Django setup done by get_asgi_application()
+from marketplace.listing_cache import coalesceListingRequests  # noqa: E402
+from marketplace.streams import accountSocket, itemEventStream, notificationWait  # noqa: E402
+
+# long-lived streams (and long polls) are served outside of Django's request handling,
+# everything else goes to Django
+STREAMS = {
+    '/items/stream/': itemEventStream,
+    '/notifications/wait/': notificationWait,
+}
+
+# listing feeds polled by every open gallery, where concurrent identical requests
+# share one response (see marketplace/listing_cache.py)
+LISTINGS = {
+    '/items/get_relative/',
+    '/items/facets/',
+    '/item_requests/get_relative/',
+    '/search/',
+}
+listing_application = coalesceListingRequests(django_application)
+
+# WebSockets (which Django does not serve at all)
+SOCKETS = {
+    '/account/socket/': accountSocket,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] in STREAMS:
+        await STREAMS[scope['path']](scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] in LISTINGS:
+        await listing_application(scope, receive, send)
+    elif scope['type'] == 'websocket':
+        if scope['path'] in SOCKETS:
+            await SOCKETS[scope['path']](scope, receive, send)
+        else:
+            await receive()
+            await send({'type': 'websocket.close'})
+    else:
+        await django_application(scope, receive, send)
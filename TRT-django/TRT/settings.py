@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "marketplace.apps.MarketplaceConfig",
     "crispy_forms",
     "background_task",
@@ -96,7 +97,10 @@ DATABASES = {
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
-DATABASES["default"] = dj_database_url.config(conn_max_age=600, ssl_require=True)
+# the PostgreSQL database given by DATABASE_URL (e.g. on Heroku), else a local
+# SQLite database (e.g. for development and benchmarks)
+if "DATABASE_URL" in os.environ:
+    DATABASES["default"] = dj_database_url.config(conn_max_age=600, ssl_require=True)
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -156,12 +160,44 @@ EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 EMAIL_NAME = "Tiger ReTail"
 
 # setup cache for email verification
+# and per-process cache for listing query results (see marketplace/listing_cache.py)
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "tokens",
-    }
+    },
+    "listings": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "listings",
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
 }
+# seconds for which listing query results may be served from the cache
+# (bounds how long a write made through another process can go unnoticed)
+LISTING_CACHE_TIMEOUT = 5
+# seconds after which each process reads the changes to its search suggestion index
+# (bounds how long a write made through another process can go unnoticed)
+SUGGESTION_INDEX_REFRESH = 60
+# time by which the in-memory indexes re-read the changes from before their last refresh,
+# so that saves still being committed then are not skipped (see marketplace/suggest.py)
+INDEX_REFRESH_MARGIN = timedelta(seconds=5)
+# search backend of the item and item request listings (see marketplace/search.py):
+# "postgres" (full text search in the database), "memory" (BM25 in each process)
+# or "sqlite" (FTS5 tables of a local SQLite database)
+SEARCH_BACKEND = "postgres" if "postgresql" in DATABASES["default"]["ENGINE"] else "sqlite"
+# seconds after which each process reloads its in-memory search indexes
+# (bounds how long a write made through another process can go unnoticed)
+SEARCH_INDEX_REFRESH = 60
+# channel layer carrying the item and account events to the streams, sockets and long
+# polls of every process (see marketplace/broadcast.py): "postgres" (NOTIFY/LISTEN)
+# or "memory" (a single local process)
+CHANNEL_LAYER = "postgres" if "postgresql" in DATABASES["default"]["ENGINE"] else "memory"
+# seconds a notifications long poll waits for a new notification before answering anyway
+# (below the 30 seconds the Heroku router allows for a response to start)
+NOTIFICATIONS_WAIT_TIMEOUT = 25
+# part of every ETag of the item pages and feeds (see marketplace/conditional.py),
+# to be changed (or set in the environment) when a release changes their rendering
+ETAG_VERSION = os.environ.get("ETAG_VERSION", "1")
 
 # list of usernames for which we allow multi-accounts
 ADMIN_USERNAMES = ["ptn_aklin", "ptn_singl", "ptn_kjm3", "ptn_sarats", "ptn_ca9", "ptn_ntyp"]
@@ -171,6 +207,10 @@ ALT_ACCOUNT_SUFFIXES = ["", "_alt_a", "_alt_b"]
 ADMIN_EMAILS = ["aklin@princeton.edu", "tigerapps@princetonusg.com"]
 # time buffer after which expired items are deleted
 EXPIRATION_BUFFER = timedelta(days=1)
+# time for which deleted items (and item requests) are remembered for the gallery delta feed (and feed ETags)
+TOMBSTONE_RETENTION = timedelta(days=7)
+# time after which pagination cursors are rejected (a page left open longer starts over)
+CURSOR_MAX_AGE = timedelta(days=7)
 
 # S3 storage
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
@@ -13,6 +13,8 @@ from .models import (
     Notification,
     ItemFlag,
     ItemRequestFlag,
+    ItemTombstone,
+    ItemRequestTombstone,
 )
 
 # Register your models here.
@@ -29,4 +31,6 @@ admin.site.register(ItemRequest)
 admin.site.register(Message)
 admin.site.register(Notification)
 admin.site.register(ItemFlag)
-admin.site.register(ItemRequestFlag)
\ No newline at end of file
+admin.site.register(ItemRequestFlag)
+admin.site.register(ItemTombstone)
+admin.site.register(ItemRequestTombstone)
\ No newline at end of file
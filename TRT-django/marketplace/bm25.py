@@ -0,0 +1,281 @@
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+import bisect
+import numpy
+import re
+import threading
+import time
+
+# ----------------------------------------------------------------------
+
+# per-process inverted index of the names and descriptions of the available
+# items (or of the item requests), ranking them with BM25, for the "memory"
+# search backend (see search.py)
+
+# the postings of every term are kept as NumPy arrays (document indexes and term
+# frequencies, all terms in one array, sliced by term), so the score of a word
+# over all documents is a few vector operations, without any database query
+
+# the index is loaded on first use and kept up to date with the writes of this
+# process by the model signals (see models.py). Every settings.SEARCH_INDEX_REFRESH
+# seconds, one search also reads the writes of other processes since the last refresh
+# (the rows updated since then and the tombstones of those deleted), outside the lock,
+# so the other searches of the process are served from the index meanwhile, and only
+# the documents that changed are replaced. If the last refresh is older than the
+# tombstones kept (settings.TOMBSTONE_RETENTION), the index is reloaded instead.
+
+# the arrays are not rebuilt on every write: the documents written since they were
+# built are masked out of them and scored apart (in plain Python), until they are
+# more than MERGE_FRACTION of all documents, when the arrays are rebuilt on the next
+# search (the collection statistics, i.e. the number of documents, the document
+# frequencies and the average length, count both, so the scores stay exact)
+
+# the sorted ranking of each search is kept until the next change, so paging
+# through the results of a search does not score them again
+
+# BM25 parameters: term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+# fraction of the documents written since the arrays were built above which they are rebuilt
+MERGE_FRACTION = 0.1
+# number of searches whose ranking is kept
+RANKINGS_KEPT = 64
+
+# words too common to search by (as the PostgreSQL english configuration ignores them)
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "i",
+    "in", "is", "it", "its", "my", "no", "not", "of", "on", "or", "so", "that", "the", "this",
+    "to", "was", "with",
+}
+
+
+# lowercase words of a text (as the words of prefixQuery, see search.py)
+
+
+def words(text):
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+class BM25Index:
+    # load(since) returns the (pk, text) of every document if since is None, else of
+    # every document changed since then, where the text of those removed is None
+    def __init__(self, load):
+        self.load = load
+        self.lock = threading.Lock()
+        self.documents = {}  # pk -> {term: frequency}
+        self.loaded_at = None
+        self.synced_at = None  # time of the database state last read
+        self.refreshing = False
+        self.arrays = None   # built from documents on the next search
+        self.positions = {}  # pk -> index in the arrays
+        self.alive = None    # whether each document of the arrays is unchanged since they were built
+        self.recent = {}     # pk -> {term: frequency} of the documents written since
+        self.changes = 0     # number of documents written or removed since
+        self.rankings = {}   # (search string, prefix) -> sorted [(score, pk)]
+
+    # load every document on first use, or read the changes since the last refresh if it is too old
+    def refresh(self):
+        with self.lock:
+            if self.loaded_at is None:
+                synced_at = timezone.now()
+                self.__replace(self.__read(None))
+                self.loaded_at, self.synced_at = time.monotonic(), synced_at
+                return
+            if self.refreshing or time.monotonic() - self.loaded_at < settings.SEARCH_INDEX_REFRESH:
+                return
+            self.refreshing = True
+            since = self.synced_at - settings.INDEX_REFRESH_MARGIN
+
+        try:
+            synced_at = timezone.now()
+            full = since < synced_at - settings.TOMBSTONE_RETENTION
+            documents = self.__read(None if full else since)
+            with self.lock:
+                if full:
+                    self.__replace(documents)
+                else:
+                    for pk, frequencies in documents.items():
+                        if self.documents.get(pk) != frequencies:
+                            self.__change(pk, frequencies)
+                self.synced_at = synced_at
+        finally:
+            with self.lock:
+                self.loaded_at = time.monotonic()
+                self.refreshing = False
+
+    # add or replace (text given) or remove (text None) one document
+    # (ignored until the index is loaded, since loading reads the latest texts)
+    def update(self, pk, text=None):
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            self.__change(pk, None if text is None else self.__frequencies(text))
+
+    # (score, pk) of every document containing all words of the search string
+    # (each word as a prefix of terms if prefix is set), sorted by score and pk
+    def ranking(self, search_string, prefix=False):
+        self.refresh()
+        query = [word for word in words(search_string) if word not in STOP_WORDS and (len(word) > 1 or not prefix)]
+        if not query:
+            return []
+
+        with self.lock:
+            key = (" ".join(query), prefix)
+            if key not in self.rankings:
+                if self.arrays is None or self.changes > MERGE_FRACTION * len(self.documents):
+                    self.__build()
+                if len(self.rankings) >= RANKINGS_KEPT:
+                    del self.rankings[next(iter(self.rankings))]
+                self.rankings[key] = self.__rank(query, prefix)
+            return self.rankings[key]
+
+    # BM25 score of every document containing all words of the search string, as {pk: score}
+    def scores(self, search_string, prefix=False):
+        return {pk: score for score, pk in self.ranking(search_string, prefix)}
+
+    # {pk: {term: frequency}} of the documents loaded since then (None if removed)
+    def __read(self, since):
+        return {pk: None if text is None else self.__frequencies(text) for pk, text in self.load(since)}
+
+    def __replace(self, documents):
+        self.documents = {pk: frequencies for pk, frequencies in documents.items() if frequencies is not None}
+        self.arrays = None
+        self.rankings = {}
+
+    def __change(self, pk, frequencies):
+        if pk in self.positions:
+            self.alive[self.positions[pk]] = False
+        if frequencies is None:
+            self.documents.pop(pk, None)
+            self.recent.pop(pk, None)
+        else:
+            self.documents[pk] = frequencies
+            self.recent[pk] = frequencies
+        self.changes += 1
+        self.rankings = {}
+
+    # sorted (score, pk) of the documents matching every word of the query
+    def __rank(self, query, prefix):
+        pks, lengths, vocabulary, offsets, postings, frequencies = self.arrays
+        alive = self.alive
+        recent_pks = list(self.recent)
+        recent = [self.recent[pk] for pk in recent_pks]
+        recent_lengths = numpy.array([sum(document.values()) for document in recent], dtype=float)
+
+        count = int(alive.sum()) + len(recent)
+        if count == 0:
+            return []
+        average_length = (lengths[alive].sum() + recent_lengths.sum()) / count
+        norms = K1 * (1 - B + B * lengths / average_length) if average_length else numpy.full(len(pks), K1)
+        recent_norms = K1 * (1 - B + B * recent_lengths / average_length) if average_length else numpy.full(len(recent), K1)
+
+        total, matched = numpy.zeros(len(pks)), alive.copy()
+        recent_total, recent_matched = numpy.zeros(len(recent)), numpy.ones(len(recent), dtype=bool)
+        for word in query:
+            # the terms of the word are a contiguous run of the sorted vocabulary
+            # (and any of the terms of the recent documents)
+            first = bisect.bisect_left(vocabulary, word)
+            if prefix:
+                last = bisect.bisect_left(vocabulary, word + "\U0010ffff")
+                terms = {term for document in recent for term in document if term.startswith(word)}
+            else:
+                last = first + 1 if first < len(vocabulary) and vocabulary[first] == word else first
+                terms = {word} if any(word in document for document in recent) else set()
+            terms = sorted(terms.union(vocabulary[first:last]))
+
+            word_scores, recent_scores = numpy.zeros(len(pks)), numpy.zeros(len(recent))
+            for term in terms:
+                index = bisect.bisect_left(vocabulary, term)
+                if index < len(vocabulary) and vocabulary[index] == term:
+                    documents = postings[offsets[index]:offsets[index + 1]]
+                    frequency = frequencies[offsets[index]:offsets[index + 1]]
+                    documents, frequency = documents[alive[documents]], frequency[alive[documents]]
+                else:
+                    documents, frequency = postings[:0], frequencies[:0]
+                recent_frequency = numpy.array([document.get(term, 0) for document in recent], dtype=float)
+
+                matching = len(documents) + numpy.count_nonzero(recent_frequency)
+                if matching == 0:
+                    continue
+                idf = numpy.log(1 + (count - matching + 0.5) / (matching + 0.5))
+                word_scores[documents] += idf * frequency * (K1 + 1) / (frequency + norms[documents])
+                recent_scores += idf * recent_frequency * (K1 + 1) / (recent_frequency + recent_norms)
+            matched &= word_scores > 0
+            total += word_scores
+            recent_matched &= recent_scores > 0
+            recent_total += recent_scores
+
+        ranking = list(zip(total[matched].tolist(), pks[matched].tolist()))
+        ranking += [(score, pk) for score, pk, kept in zip(recent_total.tolist(), recent_pks, recent_matched) if kept]
+        ranking.sort()
+        return ranking
+
+    # build the arrays (pks, lengths, vocabulary, offsets, postings, frequencies) of
+    # all documents, where the postings of the i-th term of the sorted vocabulary are
+    # postings[offsets[i]:offsets[i + 1]] (indexes into pks) with their frequencies
+    def __build(self):
+        pks = sorted(self.documents)
+        lengths = numpy.array([sum(self.documents[pk].values()) for pk in pks], dtype=float)
+
+        term_postings = {}
+        for index, pk in enumerate(pks):
+            for term, frequency in self.documents[pk].items():
+                term_postings.setdefault(term, []).append((index, frequency))
+
+        vocabulary = sorted(term_postings)
+        offsets = numpy.zeros(len(vocabulary) + 1, dtype=int)
+        offsets[1:] = numpy.cumsum([len(term_postings[term]) for term in vocabulary])
+        pairs = [pair for term in vocabulary for pair in term_postings[term]]
+        postings = numpy.array([index for index, frequency in pairs], dtype=int)
+        frequencies = numpy.array([frequency for index, frequency in pairs], dtype=float)
+
+        self.arrays = numpy.array(pks, dtype=int), lengths, vocabulary, offsets, postings, frequencies
+        self.positions = {pk: index for index, pk in enumerate(pks)}
+        self.alive = numpy.ones(len(pks), dtype=bool)
+        self.recent = {}
+        self.changes = 0
+        self.rankings = {}
+
+    @staticmethod
+    def __frequencies(text):
+        frequencies = {}
+        for word in words(text):
+            frequencies[word] = frequencies.get(word, 0) + 1
+        return frequencies
+
+
+def loadItems(since):
+    Item = apps.get_model("marketplace", "Item")
+    ItemTombstone = apps.get_model("marketplace", "ItemTombstone")
+    if since is None:
+        items = Item.objects.filter(status=Item.AVAILABLE)
+    else:
+        items = Item.objects.filter(updated_at__gt=since)
+    for pk, status, name, description in items.values_list("pk", "status", "name", "description"):
+        yield pk, name + " " + description if status == Item.AVAILABLE else None
+    if since is not None:
+        for pk in ItemTombstone.objects.filter(datetime__gt=since).values_list("item_pk", flat=True):
+            yield pk, None
+
+
+def loadItemRequests(since):
+    ItemRequest = apps.get_model("marketplace", "ItemRequest")
+    ItemRequestTombstone = apps.get_model("marketplace", "ItemRequestTombstone")
+    item_requests = ItemRequest.objects.all() if since is None else ItemRequest.objects.filter(updated_at__gt=since)
+    for pk, name, description in item_requests.values_list("pk", "name", "description"):
+        yield pk, name + " " + description
+    if since is not None:
+        for pk in ItemRequestTombstone.objects.filter(datetime__gt=since).values_list("item_request_pk", flat=True):
+            yield pk, None
+
+
+itemSearchIndex = BM25Index(loadItems)
+itemRequestSearchIndex = BM25Index(loadItemRequests)
+
+# index of each model (by label)
+SEARCH_INDEXES = {
+    "marketplace.Item": itemSearchIndex,
+    "marketplace.ItemRequest": itemRequestSearchIndex,
+}
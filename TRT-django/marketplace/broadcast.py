@@ -0,0 +1,194 @@
+from django.conf import settings
+from django.db import connections, transaction
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------------------------------------------------
+
+# in-process fan-out of events to the open live streams, sockets and waiting
+# long polls (see streams.py)
+
+# an item event is a small dict such as {"type": "listed", "pk": 12}, where
+# "listed"  : an available item was created or edited
+# "removed" : an item was deleted, frozen or completed
+# "reset"   : events may have been missed, so the client should poll for changes
+
+# an account event, {"type": "notification", "account": 7, "pk": 31} (or
+# "message"), tells the sockets and long polls of that account that it has a new
+# notification (or received a new message), by pk
+
+# every stream subscribes with its own bounded queue on its own event loop, and
+# events published from any thread are handed to that loop thread-safely, so one
+# database write reaches every open gallery tab of this process without a query
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Broadcaster:
+    # key: field of the events by which subscribers may choose theirs (e.g.
+    # "account"), events without it (e.g. resets) reaching every subscriber
+    def __init__(self, key=None):
+        self.key = key
+        self.lock = threading.Lock()
+        self.subscribers = {}  # queue -> (event loop of the queue, key value or None for all events)
+
+    # new queue of the events published from now on (only of those whose key is
+    # value, if given)
+    # (must be called from the event loop that will read the queue)
+    def subscribe(self, value=None):
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers[queue] = (asyncio.get_event_loop(), value)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            self.subscribers.pop(queue, None)
+
+    def publish(self, event):
+        key = event.get(self.key) if self.key is not None else None
+        with self.lock:
+            subscribers = list(self.subscribers.items())
+        for queue, (loop, value) in subscribers:
+            if value is not None and key is not None and key != value:
+                continue
+            try:
+                loop.call_soon_threadsafe(self.__deliver, queue, event)
+            except RuntimeError:
+                # the loop of the subscriber was closed
+                self.unsubscribe(queue)
+
+    # a subscriber too slow to keep up loses its backlog and is told to resync
+    @staticmethod
+    def __deliver(queue, event):
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            event = {"type": "reset"}
+        queue.put_nowait(event)
+
+
+itemEvents = Broadcaster()
+accountEvents = Broadcaster(key="account")
+
+
+# ----------------------------------------------------------------------
+
+# publishing events from the model signals (see models.py), through the channel
+# layer of settings.CHANNEL_LAYER, which carries them to the broadcasters of
+# every process serving streams (events are only delivered once the transaction
+# that published them commits)
+
+ITEM_EVENTS_CHANNEL = "marketplace_item_events"
+ACCOUNT_EVENTS_CHANNEL = "marketplace_account_events"
+
+# broadcaster fed by each channel
+CHANNELS = {
+    ITEM_EVENTS_CHANNEL: itemEvents,
+    ACCOUNT_EVENTS_CHANNEL: accountEvents,
+}
+
+
+def publishItemEvent(event):
+    channelLayer().send(ITEM_EVENTS_CHANNEL, event)
+
+
+def publishAccountEvent(event):
+    channelLayer().send(ACCOUNT_EVENTS_CHANNEL, event)
+
+
+# start receiving the events of the channel layer in this process, once
+# (only needed by processes serving streams)
+
+
+def startEventListener():
+    channelLayer().start()
+
+
+# ----------------------------------------------------------------------
+
+# channel layer of a single process (local development and tests): events are
+# handed to the broadcasters of this process directly on commit
+
+
+class MemoryChannelLayer:
+    def send(self, channel, event):
+        transaction.on_commit(lambda: CHANNELS[channel].publish(event))
+
+    def start(self):
+        pass
+
+
+# ----------------------------------------------------------------------
+
+# channel layer of PostgreSQL: events are sent with NOTIFY, which is delivered
+# only once the transaction commits and reaches every process (a single listener
+# thread per process feeds its broadcasters), so streams also see writes of the
+# other web processes and dynos
+
+
+class PostgresChannelLayer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listener_thread = None
+
+    def send(self, channel, event):
+        with connections["default"].cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [channel, json.dumps(event)])
+
+    def start(self):
+        with self.lock:
+            if self.listener_thread is None:
+                self.listener_thread = threading.Thread(target=self.listen, daemon=True)
+                self.listener_thread.start()
+
+    # LISTEN on a dedicated connection and publish every notification, reconnecting
+    # (and telling the subscribers to resync) whenever the connection is lost
+    def listen(self):
+        reconnecting = False
+        while True:
+            connection = None
+            try:
+                wrapper = connections["default"]
+                connection = wrapper.get_new_connection(wrapper.get_connection_params())
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    for channel in CHANNELS:
+                        cursor.execute("LISTEN " + channel)
+                if reconnecting:
+                    for broadcaster in CHANNELS.values():
+                        broadcaster.publish({"type": "reset"})
+
+                while True:
+                    if select.select([connection], [], [], 60) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        CHANNELS[notify.channel].publish(json.loads(notify.payload))
+            except Exception:
+                logger.exception("event listener lost its connection")
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            reconnecting = True
+            time.sleep(5)
+
+
+CHANNEL_LAYERS = {
+    "postgres": PostgresChannelLayer(),
+    "memory": MemoryChannelLayer(),
+}
+
+
+def channelLayer():
+    return CHANNEL_LAYERS[settings.CHANNEL_LAYER]
@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+from django.middleware.csrf import get_token
+from .encoding import feedEncoding
+from .listing_cache import listingCache, listingVersion
+from .models import Category, Item, ItemRequest, ItemRequestTombstone, ItemTombstone
+import hashlib
+import json
+
+# ----------------------------------------------------------------------
+
+# ETags of the item and item request pages, cards and feeds (used with the etag
+# view decorator), so that a client already holding the current response (a
+# browser revisiting an item page, a gallery polling the same listing) gets an
+# empty 304 Not Modified instead of a re-rendered page or re-serialized feed
+
+# ETags are strong, and derived from the updated_at timestamps (see models.py:
+# album images, categories and the seller's account also update the item), so
+# computing one costs a single indexed lookup, and the same data gives the same
+# ETag in every process
+
+# no Last-Modified is sent: deleting a row does not move the latest updated_at,
+# pages also depend on the session, and its whole seconds would hide a second
+# change within the same second
+
+
+def etagOf(*parts):
+    return hashlib.sha1(json.dumps([settings.ETAG_VERSION, *parts], default=str).encode()).hexdigest()
+
+
+# ----------------------------------------------------------------------
+
+# item and item request pages, which also depend on the logged in account
+# (navigation bar) and embed the CSRF token of the session in their forms
+# (None, i.e. no conditional response, if the object does not exist or the page
+# has messages to show once)
+
+
+def pageETag(request, updated_at):
+    if updated_at is None or len(get_messages(request)) > 0:
+        return None
+    get_token(request)  # sets the CSRF_COOKIE secret if the session has none yet
+    return etagOf(request.path, updated_at, request.session.get("username"), request.META["CSRF_COOKIE"])
+
+
+def itemPageETag(request, pk):
+    return pageETag(request, Item.objects.filter(pk=pk).values_list("updated_at", flat=True).first())
+
+
+def itemRequestPageETag(request, pk):
+    return pageETag(request, ItemRequest.objects.filter(pk=pk).values_list("updated_at", flat=True).first())
+
+
+# ----------------------------------------------------------------------
+
+# cards of one item or item request, for the requested fields
+
+
+def itemCardETag(request, pk):
+    updated_at = Item.objects.filter(pk=pk, status=Item.AVAILABLE).values_list("updated_at", flat=True).first()
+    if updated_at is None:
+        return None
+    return etagOf(request.get_full_path(), updated_at)
+
+
+def itemRequestCardETag(request, pk):
+    updated_at = ItemRequest.objects.filter(pk=pk).values_list("updated_at", flat=True).first()
+    if updated_at is None:
+        return None
+    return etagOf(request.get_full_path(), updated_at)
+
+
+# ----------------------------------------------------------------------
+
+# listing feeds and facets, for the query options (and encoding) of the request
+
+# any change to the listed rows moves the latest updated_at, and deletions move
+# the latest tombstone (two indexed lookups)
+
+# as the listing results themselves, a version is cached in this process for
+# settings.LISTING_CACHE_TIMEOUT seconds under the listing version (see
+# listing_cache.py), so a poll answered from the cache costs no query, the writes
+# of this process change the ETags at once, and those of other processes within
+# the same delay as the cached results
+
+
+def cachedVersion(kind, compute):
+    return listingCache().get_or_set(
+        kind + "-version:" + str(listingVersion()), compute, settings.LISTING_CACHE_TIMEOUT
+    )
+
+
+def itemsVersion():
+    return cachedVersion(
+        "items",
+        lambda: [
+            Item.objects.aggregate(updated_at=Max("updated_at"))["updated_at"],
+            ItemTombstone.objects.aggregate(deleted_at=Max("datetime"))["deleted_at"],
+        ],
+    )
+
+
+def itemRequestsVersion():
+    return cachedVersion(
+        "item-requests",
+        lambda: [
+            ItemRequest.objects.aggregate(updated_at=Max("updated_at"))["updated_at"],
+            ItemRequestTombstone.objects.aggregate(deleted_at=Max("datetime"))["deleted_at"],
+        ],
+    )
+
+
+# the categories only change the facets (a renamed or new category moves their
+# latest updated_at, and a deleted one their count)
+def categoriesVersion():
+    return cachedVersion(
+        "categories",
+        lambda: [
+            Category.objects.aggregate(updated_at=Max("updated_at"))["updated_at"],
+            Category.objects.count(),
+        ],
+    )
+
+
+def itemsFeedETag(request):
+    return etagOf(request.get_full_path(), feedEncoding(request), itemsVersion())
+
+
+def itemFacetsETag(request):
+    return etagOf(request.get_full_path(), itemsVersion(), categoriesVersion())
+
+
+def itemRequestsFeedETag(request):
+    return etagOf(request.get_full_path(), feedEncoding(request), itemRequestsVersion())
+
+
+# search results over both items and item requests
+
+
+def searchFeedETag(request):
+    return etagOf(request.get_full_path(), itemsVersion(), itemRequestsVersion())
@@ -0,0 +1,99 @@
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from datetime import date, datetime
+from decimal import Decimal
+import json
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are then simply not offered
+    msgpack = None
+
+# ----------------------------------------------------------------------
+
+# opt-in compact encodings of the feed views (item/item request listings,
+# notifications), chosen by the Accept header of the request
+
+# the default (application/json) keeps each view's usual layout, while the
+# compact encodings are columnar: a feed of rows is sent as one list per field,
+# e.g. {"pk": [3, 2], "datetime": [1634567890123, 1634567000000], ...}, so
+# keys are not repeated on every row, and datetimes are sent as epoch
+# milliseconds (no per-row strftime; new Date(ms) in JavaScript)
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.trt.columnar+json"
+MSGPACK = "application/msgpack"
+
+
+# encoding to respond with: the supported media type listed in the Accept header
+# with the highest quality (ties go to the first listed), or the default JSON
+
+
+def feedEncoding(request):
+    supported = [JSON, COLUMNAR_JSON]
+    if msgpack is not None:
+        supported += [MSGPACK, "application/x-msgpack"]
+
+    best, best_quality = JSON, 0
+    for media_range in request.META.get("HTTP_ACCEPT", "").split(","):
+        media_type, *parameters = [part.strip() for part in media_range.split(";")]
+        quality = 1
+        for parameter in parameters:
+            if parameter.startswith("q="):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0
+        if media_type in supported and quality > best_quality:
+            best, best_quality = media_type, quality
+
+    return MSGPACK if best == "application/x-msgpack" else best
+
+
+def isCompact(encoding):
+    return encoding != JSON
+
+
+# ----------------------------------------------------------------------
+
+# compact value of a field: epoch milliseconds for datetimes, ISO format for
+# dates, and exact strings for decimals (as the default JSON encoder does)
+
+
+def compactValue(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+# columns of rows (tuples of values in the order of fields), as {field: [values]}
+
+
+def columns(fields, rows):
+    data = {field: [] for field in fields}
+    appends = [data[field].append for field in fields]
+    for row in rows:
+        for append, value in zip(appends, row):
+            append(compactValue(value))
+    return data
+
+
+# ----------------------------------------------------------------------
+
+# response with data in the given encoding (data holds only JSON types once
+# compact, see compactValue)
+
+
+def feedResponse(encoding, data):
+    if encoding == MSGPACK:
+        response = HttpResponse(msgpack.packb(data, use_bin_type=True), content_type=MSGPACK)
+    elif encoding == COLUMNAR_JSON:
+        response = HttpResponse(json.dumps(data, separators=(",", ":")), content_type=COLUMNAR_JSON)
+    else:
+        response = JsonResponse(data)
+    patch_vary_headers(response, ["Accept"])
+    return response
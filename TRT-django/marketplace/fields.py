@@ -0,0 +1,57 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields.array import ArrayCastRHSMixin, ArrayContains, ArrayOverlap
+import json
+
+# ----------------------------------------------------------------------
+
+# ArrayField that also works on a local SQLite database, where the array is
+# stored as JSON text (e.g. "[1, 4]"), and its contains and overlap lookups are
+# answered with the JSON1 functions of SQLite (on PostgreSQL, it is a plain
+# ArrayField, with the same columns, lookups and indexes)
+
+
+class PortableArrayField(ArrayField):
+    def db_type(self, connection):
+        if connection.vendor == "postgresql":
+            return super().db_type(connection)
+        return "text"
+
+    def get_placeholder(self, value, compiler, connection):
+        if connection.vendor == "postgresql":
+            return super().get_placeholder(value, compiler, connection)
+        return "%s"
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if connection.vendor == "postgresql" or value is None:
+            return value
+        return json.dumps(list(value))
+
+    def from_db_value(self, value, expression, connection):
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+
+# rows whose array contains every value of the given list
+
+
+@PortableArrayField.register_lookup
+class PortableArrayContains(ArrayContains):
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = super(ArrayCastRHSMixin, self).process_rhs(compiler, connection)
+        sql = "NOT EXISTS (SELECT 1 FROM json_each(%s) WHERE value NOT IN (SELECT value FROM json_each(%s)))"
+        return sql % (rhs, lhs), tuple(rhs_params) + tuple(lhs_params)
+
+
+# rows whose array contains any value of the given list
+
+
+@PortableArrayField.register_lookup
+class PortableArrayOverlap(ArrayOverlap):
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = super(ArrayCastRHSMixin, self).process_rhs(compiler, connection)
+        sql = "EXISTS (SELECT 1 FROM json_each(%s) WHERE value IN (SELECT value FROM json_each(%s)))"
+        return sql % (lhs, rhs), tuple(lhs_params) + tuple(rhs_params)
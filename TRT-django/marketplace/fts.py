@@ -0,0 +1,73 @@
+from django.db import connection
+from .bm25 import STOP_WORDS
+import re
+
+# ----------------------------------------------------------------------
+
+# SQLite FTS5 full text search over the names and descriptions of the items and
+# item requests, for the "sqlite" search backend (see search.py)
+
+# each model has an external-content FTS5 table (<table>_fts, see migration 0050)
+# holding only the index of the name and description of its rows by pk, kept in
+# sync by the model signals (see models.py): the old text of a row has to be
+# removed from the index before the new one is added, so it is read before
+# every save
+
+
+def ftsTable(model):
+    return model._meta.db_table + "_fts"
+
+
+# FTS5 query of every word of the search string (each as a prefix if prefix is set)
+# (the words are extracted and quoted, so no user input reaches the FTS5 query
+# syntax, stop words are dropped as PostgreSQL does, and so are single letters of
+# prefix queries as in prefixQuery)
+
+
+def ftsQuery(search_string, prefix=False):
+    words = [word for word in re.findall(r"[^\W_]+", search_string) if word.lower() not in STOP_WORDS]
+    if prefix:
+        return " ".join('"' + word + '"*' for word in words if len(word) > 1)
+    return " ".join('"' + word + '"' for word in words)
+
+
+# BM25 score (positive) of every row of model matching the search string, as {pk: score}
+
+
+def ftsScores(model, search_string, prefix=False):
+    query = ftsQuery(search_string, prefix)
+    if not query:
+        return {}
+    table = ftsTable(model)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT rowid, -bm25(" + table + ") FROM " + table + " WHERE " + table + " MATCH %s", [query])
+        return dict(cursor.fetchall())
+
+
+# ----------------------------------------------------------------------
+
+# (name, description) of a row as currently indexed, or None if not indexed
+# (always None unless the database is SQLite)
+
+
+def indexedText(model, pk):
+    if connection.vendor != "sqlite" or pk is None:
+        return None
+    return model.objects.filter(pk=pk).values_list("name", "description").first()
+
+
+# replace the indexed old_text (if any) of a row by new_text (if any)
+
+
+def syncIndexedText(model, pk, old_text, new_text):
+    if connection.vendor != "sqlite":
+        return
+    table = ftsTable(model)
+    with connection.cursor() as cursor:
+        if old_text is not None:
+            cursor.execute(
+                "INSERT INTO " + table + "(" + table + ", rowid, name, description) VALUES ('delete', %s, %s, %s)",
+                [pk, *old_text],
+            )
+        if new_text is not None:
+            cursor.execute("INSERT INTO " + table + "(rowid, name, description) VALUES (%s, %s, %s)", [pk, *new_text])
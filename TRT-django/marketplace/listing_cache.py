@@ -0,0 +1,193 @@
+from concurrent.futures import Future
+from django.conf import settings
+from django.core.cache import caches
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+# ----------------------------------------------------------------------
+
+# short-lived, per-process cache of listing query results
+# (the gallery and item request pages poll the same queries continuously)
+
+# every cache key contains a version counter that is bumped whenever an item,
+# item request, album image, ... is saved or deleted (see models.py), so this
+# process never serves a result older than its own last write, while other
+# processes pick up the write once their entries time out
+# (settings.LISTING_CACHE_TIMEOUT seconds)
+
+
+def listingCache():
+    return caches["listings"]
+
+
+# current version of the listings
+# (starts from the clock rather than 0, so that a version counter lost to a cache
+# eviction cannot come back to a value still used by older cached results)
+
+
+def listingVersion():
+    cache = listingCache()
+    version = cache.get("version")
+    if version is None:
+        cache.add("version", time.time_ns(), None)
+        version = cache.get("version")
+    return version
+
+
+def bumpListingVersion():
+    cache = listingCache()
+    try:
+        cache.incr("version")
+    except ValueError:
+        cache.add("version", time.time_ns(), None)
+
+
+# ----------------------------------------------------------------------
+
+# normalized (search_string, condition_indexes, category_pks, sort_type, search_mode)
+# of a listing query, so that equivalent queries share cache entries
+# (the full text search ignores case and whitespace, and the order of the filters
+# does not matter)
+
+
+def normalizeListingQuery(search_string, condition_indexes, category_pks, sort_type, search_mode):
+    return [
+        " ".join(search_string.lower().split()),
+        sorted(set(condition_indexes)),
+        sorted(set(category_pks)),
+        sort_type,
+        search_mode,
+    ]
+
+
+# ----------------------------------------------------------------------
+
+# result of compute() for the listing query described by kind and key_parts,
+# from the cache if this query was computed since the last listing change
+# (a None result is returned but not cached)
+
+# on a miss, concurrent identical queries of this process wait for a single
+# computation (see SingleFlight), so a burst of galleries opening the same search
+# costs one query instead of one per thread
+
+# under ASGI (uvicorn, see TRT/asgi.py), Django 3.1 runs every sync view of a
+# process on one shared thread, so SingleFlight never sees two computations at
+# once there: the identical requests are coalesced before reaching Django instead
+# (see coalesceListingRequests below)
+# (nor are computations coalesced across processes: waiting on a lock held by
+# another process would stall every view of this one, and locking through the
+# database cache would add queries to every miss)
+
+
+def cachedListing(kind, key_parts, compute):
+    cache = listingCache()
+    digest = hashlib.sha1(json.dumps(key_parts).encode()).hexdigest()
+    key = kind + ":" + str(listingVersion()) + ":" + digest
+
+    result = cache.get(key)
+    if result is None:
+
+        def computeAndCache():
+            result = compute()
+            if result is not None:
+                cache.set(key, result, settings.LISTING_CACHE_TIMEOUT)
+            return result
+
+        result = listingFlights.do(key, computeAndCache)
+    return result
+
+
+# ----------------------------------------------------------------------
+
+# per-process coalescing of concurrent identical computations: the first caller
+# of a key computes, and the callers arriving while it runs wait for its result
+# (or exception) instead of computing it again
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}  # key -> Future of the running computation
+
+    def do(self, key, compute):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Future()
+        if not leader:
+            return flight.result()
+
+        try:
+            flight.set_result(compute())
+        except BaseException as exception:
+            flight.set_exception(exception)
+        finally:
+            with self.lock:
+                del self.flights[key]
+        return flight.result()
+
+
+listingFlights = SingleFlight()
+
+
+# ----------------------------------------------------------------------
+
+# ASGI application coalescing the concurrent identical GET requests of a listing
+# application (see TRT/asgi.py): the first request of a key goes through to it, and
+# the requests arriving while it runs wait on the event loop and are sent a copy of
+# its response, instead of each queueing for the view thread (where they would only
+# find the cached result once the first is done)
+
+# the key is the full path and the headers the listing views depend on (the Accept
+# header choosing the encoding, and the If-None-Match of conditional GETs), since the
+# listings do not depend on the session; cookies set in the first response are not
+# copied, and if it fails the waiting requests go through on their own
+
+FLIGHT_HEADERS = [b"accept", b"if-none-match"]
+
+
+def coalesceListingRequests(application):
+    flights = {}  # key -> Future of the response messages of the running request (None if it failed)
+
+    async def coalescedApplication(scope, receive, send):
+        if scope["method"] != "GET":
+            await application(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        key = (scope["path"], scope["query_string"], *[headers.get(name) for name in FLIGHT_HEADERS])
+        flight = flights.get(key)
+        if flight is not None:
+            messages = await asyncio.shield(flight)
+            if messages is None:
+                await application(scope, receive, send)
+            else:
+                for message in messages:
+                    await send(message)
+            return
+
+        flight = flights[key] = asyncio.get_running_loop().create_future()
+        messages = []
+
+        async def sendAndRecord(message):
+            messages.append(withoutCookies(message))
+            await send(message)
+
+        try:
+            await application(scope, receive, sendAndRecord)
+        finally:
+            del flights[key]
+            complete = len(messages) > 0 and not messages[-1].get("more_body", False)
+            flight.set_result(messages if complete else None)
+
+    return coalescedApplication
+
+
+def withoutCookies(message):
+    if message["type"] != "http.response.start":
+        return message
+    return dict(message, headers=[(name, value) for name, value in message["headers"] if name.lower() != b"set-cookie"])
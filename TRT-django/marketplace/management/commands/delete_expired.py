@@ -1,12 +1,13 @@
 from django.core.management.base import BaseCommand
-from marketplace.models import Item, ItemRequest, AlbumImage
+from marketplace.models import Item, ItemRequest, AlbumImage, ItemTombstone, ItemRequestTombstone
 from django.utils import timezone
 from django.conf import settings
 from django.core.files.storage import default_storage
 
 """
 Django management sub-command used to delete expired item
-listings and item requests (and their associated images from S3).
+listings and item requests (and their associated images from S3),
+as well as old tombstones of deleted items and item requests.
 
 To run this command: `python manage.py delete_expired`
 """
@@ -17,6 +18,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.__deleteExpiredItems()
         self.__deleteExpiredItemRequests()
+        self.__deleteOldTombstones()
 
     def __deleteExpiredItems(self):
         expired_items = Item.objects.filter(
@@ -46,6 +48,14 @@ class Command(BaseCommand):
             # delete the item request
             item_request.delete()
 
+    def __deleteOldTombstones(self):
+        ItemTombstone.objects.filter(
+            datetime__lt=timezone.now() - settings.TOMBSTONE_RETENTION
+        ).delete()
+        ItemRequestTombstone.objects.filter(
+            datetime__lt=timezone.now() - settings.TOMBSTONE_RETENTION
+        ).delete()
+
     def __deleteAlbumImages(self, item_id):
         album_images = AlbumImage.objects.filter(item=item_id)
         for image in album_images:
@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from marketplace.models import Item, ItemRequest
+from marketplace.pagination import keysetPosition, keysetPage
+from marketplace.views import SORT_ORDERINGS, itemCardQuerySet, itemRequestCardQuerySet
+import time
+
+"""
+Django management sub-command used to check that the gallery and item request
+page queries of every sort type use the sort indexes (see the Meta indexes of
+Item and ItemRequest), in both directions of the cursor.
+
+For each sort type and direction, prints the query plan (EXPLAIN) and the
+time to retrieve one page after the middle row, as getItemsRelative and
+getItemRequestsRelative would, and warns when the plan does not use the index
+on the sort fields (failing once all plans are printed), so a regression in the
+use of the indexes does not go unnoticed.
+
+To run this command: `python manage.py explain_sorts [--count 50] [--analyze]`
+"""
+
+class Command(BaseCommand):
+    help = 'Prints the query plans of the item and item request sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=50, help="number of rows per page")
+        parser.add_argument("--analyze", action="store_true", help="run EXPLAIN ANALYZE (PostgreSQL)")
+
+    def handle(self, *args, **options):
+        items = itemCardQuerySet(Item.objects.filter(status=Item.AVAILABLE))
+        item_requests = itemRequestCardQuerySet(ItemRequest.objects.all())
+
+        unindexed = self.__explainSorts("items", Item.objects.all(), items, options)
+        unindexed += self.__explainSorts("item requests", ItemRequest.objects.all(), item_requests, options)
+        if unindexed:
+            raise CommandError("Sorts not using their index: " + ", ".join(unindexed))
+
+    # returns the sorts (and directions) whose plan does not use their index
+    def __explainSorts(self, name, ranked, queryset, options):
+        # resume from the middle row, so that both directions have a page to read
+        pks = list(queryset.order_by("pk").values_list("pk", flat=True))
+        if not pks:
+            self.stdout.write("No " + name + " to explain")
+            return []
+        base_pk = pks[len(pks) // 2]
+
+        unindexed = []
+
+        for sort_type, ordering in SORT_ORDERINGS.items():
+            position = keysetPosition(ranked, ordering, base_pk)
+            for direction in ["forward", "backward"]:
+                page = keysetPage(queryset, ordering, position, direction, options["count"])
+
+                start = time.perf_counter()
+                rows = len(list(page))
+                milliseconds = (time.perf_counter() - start) * 1000
+
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    name + ", " + sort_type + ", " + direction
+                    + " (" + str(rows) + " rows in " + "%.2f" % milliseconds + " ms)"
+                ))
+                if options["analyze"]:
+                    self.stdout.write(page.explain(analyze=True))
+                else:
+                    self.stdout.write(page.explain())
+
+                index = self.__sortIndex(queryset.model, ordering)
+                if index is not None and index not in self.__indexPlan(page):
+                    self.stdout.write(self.style.WARNING("The plan does not use the index " + index))
+                    unindexed.append(name + ", " + sort_type + ", " + direction)
+        return unindexed
+
+    # name of the index of model on the fields of the ordering (then the pk), if any
+    @staticmethod
+    def __sortIndex(model, ordering):
+        fields = [model._meta.pk.name if field == "pk" else field for field, ascending in ordering]
+        for index in model._meta.indexes:
+            if list(index.fields) == fields:
+                return index.name
+        return None
+
+    # query plan of the page, to check for the index, where PostgreSQL plans without
+    # sequential scans, since it prefers them on small tables even if the index could serve
+    # the page (so the check tells whether the index can serve it, whatever the table size)
+    @staticmethod
+    def __indexPlan(page):
+        connection = connections[page.db]
+        if connection.vendor != "postgresql":
+            return page.explain()
+        with transaction.atomic(using=page.db), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            return page.explain()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from marketplace.models import Item, ItemRequest
+
+"""
+Django management sub-command used to (re)compute the stored full text
+search vectors of all items and item requests, e.g. for rows saved before
+the search vector triggers existed.
+
+Saved rows are otherwise kept up to date by the triggers (see migrations 0042
+and 0051). The search vectors only exist on PostgreSQL (a local SQLite
+database searches its FTS5 tables instead, see fts.py).
+
+To run this command: `python manage.py update_search_vectors`
+"""
+
+class Command(BaseCommand):
+    help = 'Recomputes the full text search vectors of all items and item requests'
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Search vectors are only stored on PostgreSQL, not on " + connection.vendor)
+
+        count = Item.objects.update(search_vector=SearchVector("name", "description"))
+        self.stdout.write("Updated search vectors of " + str(count) + " items")
+        count = ItemRequest.objects.update(search_vector=SearchVector("name", "description"))
+        self.stdout.write("Updated search vectors of " + str(count) + " item requests")
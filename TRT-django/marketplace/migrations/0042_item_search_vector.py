@@ -0,0 +1,59 @@
+# Generated by Django 3.1.14 on 2026-10-18 11:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+import marketplace.operations
+
+
+# keep Item.search_vector equal to SearchVector("name", "description")
+# whenever an item is inserted or its name or description changes
+CREATE_TRIGGER = """
+    CREATE FUNCTION marketplace_item_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector(COALESCE(NEW.name, '') || ' ' || COALESCE(NEW.description, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER marketplace_item_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON marketplace_item
+    FOR EACH ROW EXECUTE PROCEDURE marketplace_item_search_vector_update();
+"""
+
+DROP_TRIGGER = """
+    DROP TRIGGER marketplace_item_search_vector_trigger ON marketplace_item;
+    DROP FUNCTION marketplace_item_search_vector_update();
+"""
+
+BACKFILL = """
+    UPDATE marketplace_item
+    SET search_vector = to_tsvector(COALESCE(name, '') || ' ' || COALESCE(description, ''));
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0040_auto_20210825_1915'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.AddIndex(
+                model_name='item',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='item_search_vector_idx'),
+            ),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:05
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import marketplace.operations
+
+
+# fill in category_pks of existing items and item requests
+def backfillCategoryPks(apps, schema_editor):
+    for model_name in ["Item", "ItemRequest"]:
+        model = apps.get_model("marketplace", model_name)
+        for instance in model.objects.prefetch_related("categories"):
+            model.objects.filter(pk=instance.pk).update(
+                category_pks=[category.pk for category in instance.categories.all()]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0042_item_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='category_pks',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), editable=False, null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='itemrequest',
+            name='category_pks',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), editable=False, null=True, size=None),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.AddIndex(
+                model_name='item',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['category_pks'], name='item_category_pks_idx'),
+            ),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.AddIndex(
+                model_name='itemrequest',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['category_pks'], name='itemrequest_category_pks_idx'),
+            ),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.RunPython(backfillCategoryPks, migrations.RunPython.noop),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+from django.db import migrations
+import marketplace.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0044_item_changes'),
+    ]
+
+    operations = [
+        marketplace.operations.PostgresOnly(
+            django.contrib.postgres.operations.TrigramExtension(),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.AddIndex(
+                model_name='item',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='item_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            ),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.AddIndex(
+                model_name='itemrequest',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='itemrequest_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0045_name_trigram_indexes'),
+    ]
+
+    # the sort indexes of the gallery and item request page (on the sort field, then the
+    # pk, and for items only over the available ones) are added once status is a
+    # smallint, so that their predicate compares smallints
+    # (existing values are converted in place, e.g. ALTER COLUMN ... TYPE smallint
+    # USING "status"::smallint on PostgreSQL)
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='condition',
+            field=models.SmallIntegerField(choices=[(0, 'new'), (1, 'like new'), (2, 'gently loved'), (3, 'well loved'), (4, 'poor')]),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='status',
+            field=models.SmallIntegerField(choices=[(0, 'available'), (1, 'frozen'), (2, 'complete')]),
+        ),
+        migrations.AlterField(
+            model_name='itemrequest',
+            name='condition',
+            field=models.SmallIntegerField(choices=[(0, 'new'), (1, 'like new'), (2, 'gently loved'), (3, 'well loved'), (4, 'poor')]),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='status',
+            field=models.SmallIntegerField(choices=[(0, 'initiated'), (1, 'acknowledged'), (2, 'seller pending'), (3, 'buyer pending'), (4, 'complete'), (5, 'cancelled')]),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(status=0), fields=['price', 'id'], name='item_available_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(status=0), fields=['posted_date', 'id'], name='item_available_posted_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemrequest',
+            index=models.Index(fields=['price', 'id'], name='itemrequest_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemrequest',
+            index=models.Index(fields=['posted_date', 'id'], name='itemrequest_posted_date_idx'),
+        ),
+    ]
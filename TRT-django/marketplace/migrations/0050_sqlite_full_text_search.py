@@ -0,0 +1,53 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:50
+
+from django.db import migrations, models
+import marketplace.fields
+import marketplace.operations
+
+
+# external-content FTS5 tables indexing the name and description of the items
+# and item requests by pk (kept in sync by the model signals, see fts.py),
+# filled from the existing rows
+CREATE_FTS_TABLES = [
+    """
+    CREATE VIRTUAL TABLE marketplace_item_fts USING fts5(
+        name, description, content='marketplace_item', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    "INSERT INTO marketplace_item_fts(marketplace_item_fts) VALUES ('rebuild')",
+    """
+    CREATE VIRTUAL TABLE marketplace_itemrequest_fts USING fts5(
+        name, description, content='marketplace_itemrequest', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    "INSERT INTO marketplace_itemrequest_fts(marketplace_itemrequest_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS_TABLES = [
+    "DROP TABLE marketplace_item_fts",
+    "DROP TABLE marketplace_itemrequest_fts",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0048_updated_at'),
+    ]
+
+    # category_pks keeps its integer[] column on PostgreSQL, and becomes JSON text on SQLite
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='category_pks',
+            field=marketplace.fields.PortableArrayField(base_field=models.IntegerField(), editable=False, null=True, size=None),
+        ),
+        migrations.AlterField(
+            model_name='itemrequest',
+            name='category_pks',
+            field=marketplace.fields.PortableArrayField(base_field=models.IntegerField(), editable=False, null=True, size=None),
+        ),
+        marketplace.operations.SQLiteOnly(
+            migrations.RunSQL(CREATE_FTS_TABLES, DROP_FTS_TABLES),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+import marketplace.operations
+
+
+# keep ItemRequest.search_vector equal to SearchVector("name", "description")
+# whenever an item request is inserted or its name or description changes
+# (as for items, see migration 0042)
+CREATE_TRIGGER = """
+    CREATE FUNCTION marketplace_itemrequest_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector(COALESCE(NEW.name, '') || ' ' || COALESCE(NEW.description, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER marketplace_itemrequest_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON marketplace_itemrequest
+    FOR EACH ROW EXECUTE PROCEDURE marketplace_itemrequest_search_vector_update();
+"""
+
+DROP_TRIGGER = """
+    DROP TRIGGER marketplace_itemrequest_search_vector_trigger ON marketplace_itemrequest;
+    DROP FUNCTION marketplace_itemrequest_search_vector_update();
+"""
+
+BACKFILL = """
+    UPDATE marketplace_itemrequest
+    SET search_vector = to_tsvector(COALESCE(name, '') || ' ' || COALESCE(description, ''));
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0050_sqlite_full_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemrequest',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.AddIndex(
+                model_name='itemrequest',
+                index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='itemrequest_search_vector_idx'),
+            ),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        ),
+        marketplace.operations.PostgresOnly(
+            migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# count the unseen notifications of the existing accounts
+def countUnreadNotifications(apps, schema_editor):
+    Account = apps.get_model("marketplace", "Account")
+    Notification = apps.get_model("marketplace", "Notification")
+    unread = (
+        Notification.objects.filter(account=OuterRef("pk"), seen=False)
+        .order_by()
+        .values("account")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Account.objects.update(unread_notifications=Coalesce(Subquery(unread), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0051_itemrequest_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='unread_notifications',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(countUnreadNotifications, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0052_account_unread_notifications'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['account', 'datetime', 'id'], name='notification_account_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:10
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# set the watermark of the existing accounts just before their oldest unseen
+# notification (or on their most recent notification if all are seen), so no
+# unseen notification is lost, and recount their unseen notifications from it
+def setSeenThrough(apps, schema_editor):
+    Account = apps.get_model("marketplace", "Account")
+    Notification = apps.get_model("marketplace", "Notification")
+    notifications = Notification.objects.filter(account=OuterRef("pk")).order_by().values("account")
+    oldest_unseen = notifications.filter(seen=False).annotate(first=Min("pk")).values("first")
+    latest = notifications.annotate(last=Max("pk")).values("last")
+    Account.objects.update(
+        notifications_seen_through=Coalesce(Subquery(oldest_unseen) - 1, Subquery(latest), Value(0))
+    )
+
+    unread = (
+        notifications.filter(pk__gt=OuterRef("notifications_seen_through"))
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Account.objects.update(unread_notifications=Coalesce(Subquery(unread), Value(0)))
+
+
+# mark seen again the notifications up to the watermark of their account
+def setSeen(apps, schema_editor):
+    Account = apps.get_model("marketplace", "Account")
+    Notification = apps.get_model("marketplace", "Notification")
+    seen_through = Account.objects.filter(pk=OuterRef("account")).values("notifications_seen_through")
+    Notification.objects.filter(pk__lte=Subquery(seen_through)).update(seen=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0053_notification_account_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='notifications_seen_through',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(setSeenThrough, setSeen),
+        migrations.RemoveField(
+            model_name='notification',
+            name='seen',
+        ),
+    ]
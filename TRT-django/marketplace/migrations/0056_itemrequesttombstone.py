@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0054_notifications_seen_through'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemRequestTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_request_pk', models.IntegerField()),
+                ('datetime', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-18 23:45
+
+from django.db import migrations
+
+
+# fill in category_pks of the items and item requests left without one: 0043 only
+# backfilled PostgreSQL databases, so the rows of a local SQLite database that
+# existed then never matched a category filter or facet (rows saved since are kept
+# in sync by the m2m signals, see models.py)
+def backfillCategoryPks(apps, schema_editor):
+    for model_name in ["Item", "ItemRequest"]:
+        model = apps.get_model("marketplace", model_name)
+        for instance in model.objects.filter(category_pks__isnull=True).prefetch_related("categories"):
+            model.objects.filter(pk=instance.pk).update(
+                category_pks=[category.pk for category in instance.categories.all()]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0057_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfillCategoryPks, migrations.RunPython.noop),
+    ]
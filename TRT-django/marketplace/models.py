@@ -1,12 +1,21 @@
 from django.db import models
+from django.db.models import F, Q
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.forms.widgets import NumberInput
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.dispatch import receiver
-from django.db.models.signals import post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from decimal import Decimal
 from datetime import timedelta
+from .listing_cache import bumpListingVersion
+from .broadcast import publishItemEvent, publishAccountEvent
+from .suggest import suggestionIndex
+from .bm25 import itemSearchIndex, itemRequestSearchIndex
+from .fields import PortableArrayField
+from .fts import indexedText, syncIndexedText
 
 
 # followed Django documentation on Model fields for the following
@@ -22,14 +31,36 @@ class Account(models.Model):
     email_activity = models.BooleanField(default=False)          # receive email about any activity
     email_unread_notification = models.BooleanField(default=True) # receive email about unread notification
     remind_set_email_settings = models.BooleanField(default=True)
+    # number of unseen notifications, only ever changed by F() updates
+    # (see seeNotifications and the Notification signals at the bottom of file)
+    unread_notifications = models.IntegerField(default=0, editable=False)
+    # pk of the most recent notification seen: the notifications up to it are seen,
+    # the later ones unseen (only ever moved forward by seeNotifications)
+    notifications_seen_through = models.IntegerField(default=0, editable=False)
+
+    # fields only ever changed by updates of their own
+    UPDATED_SEPARATELY = ["unread_notifications", "notifications_seen_through"]
 
     def __str__(self):
         return self.username
 
+    # saving a loaded account must not write back the (possibly stale) unread count
+    # and watermark it was loaded with, so only the other fields are updated
+    def save(self, *args, **kwargs):
+        if not self._state.adding and self.pk is not None and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in Account.UPDATED_SEPARATELY
+            ]
+        super().save(*args, **kwargs)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=50)
     description = models.CharField(max_length=200)
+    # last time the category changed, for the item facets ETag (see conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ["name"]
@@ -105,32 +136,61 @@ class Item(models.Model):
         ],
     )
     negotiable = models.BooleanField()
-    condition = models.DecimalField(
-        max_digits=1,
-        decimal_places=0,
+    condition = models.SmallIntegerField(
         choices=[
             (CONDITION['index'], CONDITION['name']) for CONDITION in CONDITIONS
         ],
     )
     categories = models.ManyToManyField(Category)
+    # pks of categories, kept in sync with the categories m2m field (see bottom of file),
+    # so filtering by categories needs no join
+    category_pks = PortableArrayField(models.IntegerField(), null=True, editable=False)
     description = models.CharField(max_length=1000)
     image = models.ImageField(upload_to="images/")
-    status = models.DecimalField(
-        max_digits=1,
-        decimal_places=0,
+    status = models.SmallIntegerField(
         choices=[
             (STATUS['index'], STATUS['name']) for STATUS in STATUSES
         ],
     )
+    # full text search vector of name and description,
+    # kept up to date by a database trigger (see migration 0042)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # last time the item (or its album/categories/seller) changed, for the gallery
+    # delta feed and conditional GETs (see conditional.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # partial composite indexes for keyset pagination of the gallery sorts
+        # (only over the AVAILABLE items, the only ones the gallery shows,
+        # and walked in either direction for both directions of each sort)
+        indexes = [
+            models.Index(fields=["price", "id"], name="item_available_price_idx", condition=Q(status=0)),
+            models.Index(fields=["posted_date", "id"], name="item_available_posted_date_idx", condition=Q(status=0)),
+            GinIndex(fields=["search_vector"], name="item_search_vector_idx"),
+            GinIndex(fields=["category_pks"], name="item_category_pks_idx"),
+            GinIndex(fields=["name"], name="item_name_trgm_idx", opclasses=["gin_trgm_ops"]),
+        ]
 
     def __str__(self):
         return self.name + " by " + str(self.seller)
 
 
+# record of a deleted item, so the gallery delta feed can report deletions
+# (pruned after settings.TOMBSTONE_RETENTION)
+class ItemTombstone(models.Model):
+    item_pk = models.IntegerField()
+    datetime = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return str(self.item_pk) + " deleted at " + str(self.datetime)
+
+
 # wrapper for ImageField, used for item albums
 class AlbumImage(models.Model):
     image = models.ImageField(upload_to="images/")
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="album")
+    # last time the image changed (its item is updated too, see bottom of file)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return str(self.item)
@@ -172,9 +232,7 @@ class Transaction(models.Model):
 
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     buyer = models.ForeignKey(Account, on_delete=models.CASCADE)
-    status = models.DecimalField(
-        max_digits=1,
-        decimal_places=0,
+    status = models.SmallIntegerField(
         choices=[
             (STATUS["index"], STATUS["name"]) for STATUS in STATUSES
         ],
@@ -232,21 +290,46 @@ class ItemRequest(models.Model):
         ],
     )
     negotiable = models.BooleanField()
-    condition = models.DecimalField(
-        max_digits=1,
-        decimal_places=0,
+    condition = models.SmallIntegerField(
         choices=[
             (CONDITION['index'], CONDITION['name']) for CONDITION in Item.CONDITIONS
         ],
     )
     categories = models.ManyToManyField(Category)
+    # pks of categories, kept in sync with the categories m2m field (see bottom of file)
+    category_pks = PortableArrayField(models.IntegerField(), null=True, editable=False)
     description = models.CharField(max_length=1000)
     image = models.ImageField(upload_to="images/")
+    # full text search vector of name and description,
+    # kept up to date by a database trigger (see migration 0051)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # last time the item request (or its categories) changed, for conditional GETs (see conditional.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # composite indexes for keyset pagination of the item request sorts
+        indexes = [
+            models.Index(fields=["price", "id"], name="itemrequest_price_idx"),
+            models.Index(fields=["posted_date", "id"], name="itemrequest_posted_date_idx"),
+            GinIndex(fields=["search_vector"], name="itemrequest_search_vector_idx"),
+            GinIndex(fields=["category_pks"], name="itemrequest_category_pks_idx"),
+            GinIndex(fields=["name"], name="itemrequest_name_trgm_idx", opclasses=["gin_trgm_ops"]),
+        ]
 
     def __str__(self):
         return self.name + " by " + str(self.requester)
 
 
+# record of a deleted item request, so the item request feed ETags change on deletions
+# (pruned after settings.TOMBSTONE_RETENTION)
+class ItemRequestTombstone(models.Model):
+    item_request_pk = models.IntegerField()
+    datetime = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return str(self.item_request_pk) + " deleted at " + str(self.datetime)
+
+
 class ItemRequestLog(models.Model):
     item_request = models.ForeignKey(
         ItemRequest, on_delete=models.CASCADE, related_name="logs"
@@ -278,9 +361,17 @@ class Notification(models.Model):
     )
     datetime = models.DateTimeField()
     text = models.CharField(max_length=500)
-    seen = models.BooleanField(default=False)
     url = models.URLField()
 
+    # notifications not yet seen by their account (see Account.notifications_seen_through)
+    UNSEEN = Q(pk__gt=F("account__notifications_seen_through"))
+
+    class Meta:
+        # composite index for keyset pagination of the notifications of an account
+        indexes = [
+            models.Index(fields=["account", "datetime", "id"], name="notification_account_idx"),
+        ]
+
 class ItemFlag(models.Model):
     reporter = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="item_flags", null=True)
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="flags")
@@ -306,3 +397,220 @@ def deleteAlbumImage(sender, instance, **kwargs):
 @receiver(post_delete, sender=ItemRequest)
 def deleteItemRequestImage(sender, instance, **kwargs):
     instance.image.delete(save=False)
+
+
+############## INVALIDATE CACHED LISTING QUERIES ###################
+# any change to what the gallery or item request pages show starts a new listing version
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=AlbumImage)
+@receiver(post_delete, sender=AlbumImage)
+@receiver(post_save, sender=ItemRequest)
+@receiver(post_delete, sender=ItemRequest)
+@receiver(post_save, sender=Account)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Item.categories.through)
+@receiver(m2m_changed, sender=ItemRequest.categories.through)
+def invalidateListings(sender, **kwargs):
+    bumpListingVersion()
+
+
+############## DENORMALIZE CATEGORY MEMBERSHIP ###################
+# recompute category_pks of the given items/item requests from their categories
+def syncCategoryPks(model, pks):
+    for instance in model.objects.filter(pk__in=pks).prefetch_related("categories"):
+        model.objects.filter(pk=instance.pk).update(
+            category_pks=[category.pk for category in instance.categories.all()], updated_at=timezone.now()
+        )
+
+
+@receiver(m2m_changed, sender=Item.categories.through)
+@receiver(m2m_changed, sender=ItemRequest.categories.through)
+def syncCategoryPksOnChange(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    # changed from the item/item request side
+    if not reverse:
+        syncCategoryPks(type(instance), [instance.pk])
+    # changed from the category side, where model is Item/ItemRequest
+    else:
+        pks = set(pk_set or [])
+        pks.update(model.objects.filter(category_pks__contains=[instance.pk]).values_list("pk", flat=True))
+        syncCategoryPks(model, pks)
+
+
+# deleting a category removes its m2m rows without sending m2m_changed
+@receiver(post_delete, sender=Category)
+def syncCategoryPksOnDelete(sender, instance, **kwargs):
+    for model in [Item, ItemRequest]:
+        syncCategoryPks(model, model.objects.filter(category_pks__contains=[instance.pk]).values_list("pk", flat=True))
+
+
+############## TRACK ITEM CHANGES FOR THE DELTA FEED AND ETAGS ###################
+@receiver(post_delete, sender=Item)
+def createItemTombstone(sender, instance, **kwargs):
+    ItemTombstone(item_pk=instance.pk, datetime=timezone.now()).save()
+
+
+@receiver(post_delete, sender=ItemRequest)
+def createItemRequestTombstone(sender, instance, **kwargs):
+    ItemRequestTombstone(item_request_pk=instance.pk, datetime=timezone.now()).save()
+
+
+# album images are part of the item card, so changing them changes the item
+@receiver(post_save, sender=AlbumImage)
+@receiver(post_delete, sender=AlbumImage)
+def touchAlbumItem(sender, instance, **kwargs):
+    Item.objects.filter(pk=instance.item_id).update(updated_at=timezone.now())
+
+
+# so are the contact and email of the seller (and of the requester of an item request),
+# but only those: other saves of the account (settings, counters) leave its items as
+# they were, so the contact and email are read before the save to compare with
+CARD_ACCOUNT_FIELDS = ["contact", "email"]
+
+
+@receiver(pre_save, sender=Account)
+def readCardAccountFields(sender, instance, update_fields=None, **kwargs):
+    instance.card_fields = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(CARD_ACCOUNT_FIELDS):
+        return
+    instance.card_fields = Account.objects.filter(pk=instance.pk).values_list(*CARD_ACCOUNT_FIELDS).first()
+
+
+@receiver(post_save, sender=Account)
+def touchAccountItems(sender, instance, created, **kwargs):
+    card_fields = getattr(instance, "card_fields", None)
+    if created or card_fields is None:
+        return
+    if card_fields == tuple(getattr(instance, field) for field in CARD_ACCOUNT_FIELDS):
+        return
+    Item.objects.filter(seller=instance).update(updated_at=timezone.now())
+    ItemRequest.objects.filter(requester=instance).update(updated_at=timezone.now())
+
+
+############## PUBLISH LIVE ITEM EVENTS ###################
+# pushed to the open gallery streams (see broadcast.py, streams.py)
+@receiver(post_save, sender=Item)
+def publishItemSaved(sender, instance, **kwargs):
+    if instance.status == Item.AVAILABLE:
+        publishItemEvent({"type": "listed", "pk": instance.pk})
+    else:
+        publishItemEvent({"type": "removed", "pk": instance.pk})
+
+
+@receiver(post_delete, sender=Item)
+def publishItemDeleted(sender, instance, **kwargs):
+    publishItemEvent({"type": "removed", "pk": instance.pk})
+
+
+############## UPDATE SEARCH SUGGESTIONS ###################
+# keep the suggestion index of this process in step with its writes (see suggest.py)
+@receiver(post_save, sender=Item)
+def suggestItemSaved(sender, instance, **kwargs):
+    suggestionIndex.update("item", instance.pk, instance.name if instance.status == Item.AVAILABLE else None)
+
+
+@receiver(post_save, sender=ItemRequest)
+def suggestItemRequestSaved(sender, instance, **kwargs):
+    suggestionIndex.update("item_request", instance.pk, instance.name)
+
+
+@receiver(post_save, sender=Category)
+def suggestCategorySaved(sender, instance, **kwargs):
+    suggestionIndex.update("category", instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Item)
+def suggestItemDeleted(sender, instance, **kwargs):
+    suggestionIndex.update("item", instance.pk)
+
+
+@receiver(post_delete, sender=ItemRequest)
+def suggestItemRequestDeleted(sender, instance, **kwargs):
+    suggestionIndex.update("item_request", instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def suggestCategoryDeleted(sender, instance, **kwargs):
+    suggestionIndex.update("category", instance.pk)
+
+
+############## UPDATE IN-MEMORY SEARCH INDEXES ###################
+# keep the search indexes of this process in step with its writes (see bm25.py)
+@receiver(post_save, sender=Item)
+def indexItemSaved(sender, instance, **kwargs):
+    if instance.status == Item.AVAILABLE:
+        itemSearchIndex.update(instance.pk, instance.name + " " + instance.description)
+    else:
+        itemSearchIndex.update(instance.pk)
+
+
+@receiver(post_save, sender=ItemRequest)
+def indexItemRequestSaved(sender, instance, **kwargs):
+    itemRequestSearchIndex.update(instance.pk, instance.name + " " + instance.description)
+
+
+@receiver(post_delete, sender=Item)
+def indexItemDeleted(sender, instance, **kwargs):
+    itemSearchIndex.update(instance.pk)
+
+
+@receiver(post_delete, sender=ItemRequest)
+def indexItemRequestDeleted(sender, instance, **kwargs):
+    itemRequestSearchIndex.update(instance.pk)
+
+
+############## SYNC SQLITE FULL TEXT SEARCH TABLES ###################
+# on a local SQLite database, replace the indexed name and description of saved
+# and deleted rows (see fts.py), reading the text as indexed before the change
+@receiver(pre_save, sender=Item)
+@receiver(pre_save, sender=ItemRequest)
+def readIndexedText(sender, instance, **kwargs):
+    instance.indexed_text = indexedText(sender, instance.pk)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=ItemRequest)
+def syncIndexedTextSaved(sender, instance, **kwargs):
+    syncIndexedText(sender, instance.pk, instance.indexed_text, (instance.name, instance.description))
+
+
+@receiver(pre_delete, sender=Item)
+@receiver(pre_delete, sender=ItemRequest)
+def syncIndexedTextDeleted(sender, instance, **kwargs):
+    syncIndexedText(sender, instance.pk, indexedText(sender, instance.pk), None)
+
+
+############## COUNT UNREAD NOTIFICATIONS ###################
+# keep Account.unread_notifications equal to the number of unseen notifications
+# (new notifications are always after the watermark, and notifications are only
+# marked seen by moving it, see seeNotifications)
+@receiver(post_save, sender=Notification)
+def countNotificationSaved(sender, instance, created, **kwargs):
+    if created:
+        Account.objects.filter(pk=instance.account_id).update(unread_notifications=F("unread_notifications") + 1)
+
+
+@receiver(post_delete, sender=Notification)
+def countNotificationDeleted(sender, instance, **kwargs):
+    Account.objects.filter(pk=instance.account_id, notifications_seen_through__lt=instance.pk).update(
+        unread_notifications=F("unread_notifications") - 1
+    )
+
+
+############## PUSH ACCOUNT EVENTS ###################
+# new notifications and messages, pushed to the sockets and long polls of their account (see streams.py)
+@receiver(post_save, sender=Notification)
+def publishNotificationSaved(sender, instance, created, **kwargs):
+    if created:
+        publishAccountEvent({"type": "notification", "account": instance.account_id, "pk": instance.pk})
+
+
+@receiver(post_save, sender=Message)
+def publishMessageSaved(sender, instance, created, **kwargs):
+    if created:
+        publishAccountEvent({"type": "message", "account": instance.receiver_id, "pk": instance.pk})
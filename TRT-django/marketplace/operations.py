@@ -0,0 +1,43 @@
+from django.db.migrations.operations.base import Operation
+
+# ----------------------------------------------------------------------
+
+# migration operation wrappers for schema changes specific to one database
+# (GIN indexes, triggers and extensions of PostgreSQL, full text search tables of SQLite, ...)
+
+# the wrapped operation always updates the migration state, but only touches
+# the database when it is of the given vendor, so the migrations still apply
+# cleanly to both the PostgreSQL database and a local SQLite database
+
+
+class VendorOnly(Operation):
+    reversible = True
+    vendor = None
+    vendor_name = None
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def state_forwards(self, app_label, state):
+        self.operation.state_forwards(app_label, state)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            self.operation.database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            self.operation.database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return self.operation.describe() + " (" + self.vendor_name + " only)"
+
+
+class PostgresOnly(VendorOnly):
+    vendor = "postgresql"
+    vendor_name = "PostgreSQL"
+
+
+class SQLiteOnly(VendorOnly):
+    vendor = "sqlite"
+    vendor_name = "SQLite"
@@ -0,0 +1,154 @@
+from django.conf import settings
+from django.core import signing
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+import json
+
+# ----------------------------------------------------------------------
+
+# keyset (seek) pagination helpers for the relative retrieval views
+
+# an ordering is a list of (field, ascending) pairs ending with the unique
+# "pk" field, so that every row has exactly one position in the ordering
+# e.g. [("price", True), ("pk", True)]
+
+# a position is the list of values of the ordering's fields for one row,
+# so the next page is a range query starting right after that position
+# (instead of numbering every row with a window function)
+
+
+# ----------------------------------------------------------------------
+
+# order_by arguments to walk the ordering in the given direction
+# (forward follows the ordering, backward reverses it)
+
+
+def keysetOrderBy(ordering, direction):
+    order_by = []
+    for field, ascending in ordering:
+        if ascending == (direction == "forward"):
+            order_by.append(F(field).asc())
+        else:
+            order_by.append(F(field).desc())
+    return order_by
+
+
+# ----------------------------------------------------------------------
+
+# filter for the rows strictly after (forward) or strictly before (backward)
+# the given position, expanded as
+# (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+
+# the redundant inclusive bound on the leading field lets the database
+# start an index range scan at the position instead of filtering every row
+
+
+def keysetFilter(ordering, position, direction):
+    condition = Q()
+    equal = Q()
+    for (field, ascending), value in zip(ordering, position):
+        lookup = "gt" if ascending == (direction == "forward") else "lt"
+        condition |= equal & Q(**{field + "__" + lookup: value})
+        equal &= Q(**{field: value})
+
+    field, ascending = ordering[0]
+    lookup = "gte" if ascending == (direction == "forward") else "lte"
+    return Q(**{field + "__" + lookup: position[0]}) & condition
+
+
+# ----------------------------------------------------------------------
+
+# position of the row with the given pk in a queryset annotated with every
+# field of the ordering, or None if there is no such row
+
+
+def keysetPosition(queryset, ordering, pk):
+    return queryset.filter(pk=pk).values_list(
+        *[field for field, ascending in ordering]
+    ).first()
+
+
+# ----------------------------------------------------------------------
+
+# the next count rows of queryset after position in the given direction
+# (if position is None, starts from the beginning/end based on direction)
+
+
+def keysetPage(queryset, ordering, position, direction, count):
+    if position is not None:
+        queryset = queryset.filter(keysetFilter(ordering, position, direction))
+    return queryset.order_by(*keysetOrderBy(ordering, direction))[:count]
+
+
+# ----------------------------------------------------------------------
+
+# opaque signed cursors, so clients can resume right after the last row
+# they received without the server looking that row up again
+
+# a cursor carries the ordering it was made for and the position of the row,
+# with Decimal/datetime values kept as strings (the filter converts them back)
+
+
+class CursorSerializer:
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":"), default=str).encode("latin-1")
+
+    def loads(self, data):
+        return json.loads(data.decode("latin-1"))
+
+
+def encodeCursor(ordering, position):
+    return signing.dumps(
+        [ordering, list(position)],
+        salt="marketplace.pagination",
+        serializer=CursorSerializer,
+        compress=True,
+    )
+
+
+# position stored in the cursor, or None if the cursor is invalid, was made
+# for a different ordering, or is older than settings.CURSOR_MAX_AGE
+
+
+def decodeCursor(cursor, ordering):
+    try:
+        cursor_ordering, position = signing.loads(
+            cursor, salt="marketplace.pagination", serializer=CursorSerializer, max_age=settings.CURSOR_MAX_AGE
+        )
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if cursor_ordering != [list(pair) for pair in ordering] or len(position) != len(ordering):
+        return None
+    return position
+
+
+# cursor to resume after the last of the retrieved rows
+# (if no rows were retrieved, resumes from the same position again)
+
+
+def nextCursor(ordering, rows, position):
+    if rows:
+        position = [getattr(rows[-1], field) for field, ascending in ordering]
+    if position is None:
+        return None
+    return encodeCursor(ordering, position)
+
+
+# ----------------------------------------------------------------------
+
+# opaque signed watermarks (points in time) for the delta feeds,
+# so clients can ask for what changed since their last poll
+
+
+def encodeWatermark(datetime):
+    return signing.dumps(datetime.isoformat(), salt="marketplace.watermark")
+
+
+# datetime stored in the watermark, or None if the watermark is invalid
+
+
+def decodeWatermark(watermark):
+    try:
+        return parse_datetime(signing.loads(watermark, salt="marketplace.watermark"))
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
@@ -0,0 +1,277 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Cast
+from .bm25 import SEARCH_INDEXES
+from .fts import ftsScores
+from .pagination import keysetOrderBy, keysetPage, keysetPosition
+import bisect
+import math
+import re
+
+# ----------------------------------------------------------------------
+
+# full text search over the stored search vectors of the items and item requests
+# (see Item.search_vector and ItemRequest.search_vector)
+
+# items are sorted by search rank (and by unique pk to make tie-breaks consistent),
+# where the items matching the search string have a positive rank and all others
+# have rank 0
+
+RANK_ORDERING = [("rank", True), ("pk", True)]
+PK_ORDERING = [("pk", True)]
+
+# ordering of the matching rows of several querysets at once (see searchPage below),
+# where kind tells the rows of each queryset apart
+SEARCH_ORDERING = [("rank", True), ("kind", True), ("pk", True)]
+
+
+# search modes
+# ""      : plain full text search (every word of the search string, stemmed)
+# "fuzzy" : full text search of the words as prefixes ("micro" finds "microwave"),
+#           or trigram similarity of the name to the search string (finds typos),
+#           ranked by the sum of both (see the trigram indexes on the names)
+SEARCH_MODES = ["", "fuzzy"]
+
+
+# tsquery of every word of the search string as a prefix
+# (the words are extracted, so no user input reaches the tsquery syntax, and
+# single letters, e.g. the "s" of "chair's", are dropped since they prefix anything)
+
+
+def prefixQuery(search_string):
+    words = [word for word in re.findall(r"[^\W_]+", search_string) if len(word) > 1]
+    if not words:
+        return SearchQuery(search_string)
+    return SearchQuery(" & ".join(word + ":*" for word in words), search_type="raw")
+
+
+# filter for the rows matching the search string, where vector is the
+# name of the (stored or annotated) search vector
+
+
+def searchMatch(search_string, search_mode, vector="search_vector"):
+    if search_mode == "fuzzy":
+        return Q(**{vector: prefixQuery(search_string)}) | Q(name__trigram_similar=search_string)
+    return Q(**{vector: SearchQuery(search_string)})
+
+
+# search rank of the rows, for annotating items/item requests
+# (positive for the matching rows and 0 for all others)
+
+# the rank is cast to double precision: ts_rank_cd and similarity return a real,
+# which reaches Python (and the cursors) as the float nearest to the real, but is
+# widened to a different double when compared with that float in the keyset
+# filter, so the rows tied with the position would be lost (or repeated)
+
+
+def searchRank(search_string, search_mode="", vector="search_vector"):
+    if search_mode == "fuzzy":
+        rank = SearchRank(F(vector), prefixQuery(search_string), cover_density=True)
+        rank += TrigramSimilarity("name", search_string)
+        rank = Case(
+            When(searchMatch(search_string, search_mode, vector), then=rank),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    else:
+        rank = SearchRank(F(vector), SearchQuery(search_string), cover_density=True)
+    return Cast(rank, FloatField())
+
+
+# ----------------------------------------------------------------------
+
+# page of queryset in the rank ordering after position (see pagination.py)
+
+# the matching items are found through the GIN indexes (on the search vector,
+# and on the name for trigrams), and the rest (all of rank 0, so ordered by pk alone) are only scanned once
+# the page runs past the matching items
+
+
+def rankedPage(queryset, search_string, search_mode, position, direction, count):
+    rank = searchRank(search_string, search_mode)
+    matching = queryset.filter(searchMatch(search_string, search_mode)).annotate(rank=rank).filter(rank__gt=0)
+    rest = queryset.annotate(rank=rank).filter(rank=0)
+
+    rows = []
+    for tier_matching, tier_position in rankTiers(position, direction):
+        if len(rows) < count:
+            if tier_matching:
+                rows += keysetPage(matching, RANK_ORDERING, tier_position, direction, count - len(rows))
+            else:
+                rows += keysetPage(rest, PK_ORDERING, tier_position, direction, count - len(rows))
+    return rows
+
+
+# tiers of the rank ordering to page through after position, as (matching, position
+# in the tier), where the rest come before the matching items going forward, and
+# after them going backward
+
+
+def rankTiers(position, direction):
+    if position is not None and position[0] > 0:
+        tiers = [(True, position)]
+        if direction == "backward":
+            tiers.append((False, None))
+    elif position is not None:
+        tiers = [(False, position[1:])]
+        if direction == "forward":
+            tiers.append((True, None))
+    elif direction == "forward":
+        tiers = [(False, None), (True, None)]
+    else:
+        tiers = [(True, None), (False, None)]
+    return tiers
+
+
+# ----------------------------------------------------------------------
+
+# search backends of the listing views, chosen by settings.SEARCH_BACKEND
+# "postgres" : full text search (and trigram similarity) in the database, as above
+# "memory"   : BM25 over in-memory indexes of this process (see bm25.py)
+# "sqlite"   : BM25 of the SQLite FTS5 tables (see fts.py), for a local SQLite database
+# (where the "fuzzy" mode of the last two matches the words as prefixes, but does not find typos)
+
+# a backend searches a queryset of items or item requests with
+# filterMatching(queryset, search_string, search_mode)
+#     the matching rows of queryset
+# rankPosition(queryset, pk, search_string, search_mode)
+#     the RANK_ORDERING position of the row with the given pk, or None if there is no such row
+# rankedPage(queryset, search_string, search_mode, position, direction, count)
+#     the next count rows (with their rank attribute) after position in the RANK_ORDERING
+# searchPage(querysets, search_string, search_mode, position, direction, count)
+#     the (rank, kind, pk) of the next count matching rows of all querysets after position
+#     in the SEARCH_ORDERING, where kind is the index of the queryset of the row
+
+
+class PostgresSearchBackend:
+    def filterMatching(self, queryset, search_string, search_mode):
+        return queryset.filter(searchMatch(search_string, search_mode))
+
+    def rankPosition(self, queryset, pk, search_string, search_mode):
+        return keysetPosition(queryset.annotate(rank=searchRank(search_string, search_mode)), RANK_ORDERING, pk)
+
+    def rankedPage(self, queryset, search_string, search_mode, position, direction, count):
+        return rankedPage(queryset, search_string, search_mode, position, direction, count)
+
+    # the matching rows of every queryset are ranked (through the GIN indexes)
+    # and merged in one UNION query
+    # (every part ranks with searchRank, whose double precision rank is compared
+    # exactly with the rank of the position, so rows tied on rank are kept)
+    def searchPage(self, querysets, search_string, search_mode, position, direction, count):
+        rank = searchRank(search_string, search_mode)
+        parts = []
+        for kind, queryset in enumerate(querysets):
+            part = queryset.filter(searchMatch(search_string, search_mode)).annotate(
+                rank=rank, kind=Value(kind, output_field=IntegerField())
+            )
+            part = part.filter(rank__gt=0).values_list("rank", "kind", "pk")
+            parts.append(keysetPage(part, SEARCH_ORDERING, position, direction, count))
+        union = parts[0].union(*parts[1:], all=True)
+        return list(union.order_by(*keysetOrderBy(SEARCH_ORDERING, direction))[:count])
+
+
+# backends ranking the matching rows outside of the ordering query, where
+# ranking(queryset, search_string, search_mode) is the sorted [(rank, pk)] of the
+# matching rows of the model of queryset (ranks are positive, and all others are 0)
+
+# the ranking only holds the matching rows, which are checked against the filters of
+# queryset a few at a time (see __filteredSlice), and the rest are paged by pk in the
+# database, so a page never loads every pk of queryset
+
+
+class ScoredSearchBackend:
+    def filterMatching(self, queryset, search_string, search_mode):
+        return queryset.filter(pk__in=[pk for rank, pk in self.ranking(queryset, search_string, search_mode)])
+
+    def rankPosition(self, queryset, pk, search_string, search_mode):
+        if not queryset.filter(pk=pk).exists():
+            return None
+        for rank, ranked_pk in self.ranking(queryset, search_string, search_mode):
+            if ranked_pk == pk:
+                return [rank, pk]
+        return [0.0, pk]
+
+    def rankedPage(self, queryset, search_string, search_mode, position, direction, count):
+        keys = self.ranking(queryset, search_string, search_mode)
+        rest = queryset.exclude(pk__in=[pk for rank, pk in keys])
+
+        rows = []
+        for tier_matching, tier_position in rankTiers(position, direction):
+            if len(rows) >= count:
+                break
+            if tier_matching:
+                cut = None if tier_position is None else tuple(tier_position)
+                page = self.__filteredSlice(queryset, keys, cut, direction, count - len(rows))
+                found = queryset.in_bulk([pk for rank, pk in page])
+                for rank, pk in page:
+                    if pk in found:
+                        found[pk].rank = rank
+                        rows.append(found[pk])
+            else:
+                for row in keysetPage(rest, PK_ORDERING, tier_position, direction, count - len(rows)):
+                    row.rank = 0.0
+                    rows.append(row)
+        return rows
+
+    # the rows of each kind after position are found apart, and the first count of them merged
+    # (where the rows tied on rank with position are after it if their kind is after its kind)
+    def searchPage(self, querysets, search_string, search_mode, position, direction, count):
+        keys = []
+        for kind, queryset in enumerate(querysets):
+            cut = None
+            if position is not None:
+                position_rank, position_kind, position_pk = position
+                if kind == position_kind:
+                    cut = (position_rank, position_pk)
+                else:
+                    cut = (position_rank, math.inf if kind < position_kind else -math.inf)
+            ranking = self.ranking(queryset, search_string, search_mode)
+            keys += [(rank, kind, pk) for rank, pk in self.__filteredSlice(queryset, ranking, cut, direction, count)]
+        return sorted(keys, reverse=direction == "backward")[:count]
+
+    # the next count of the sorted keys after cut in the given direction whose pk is in
+    # queryset, checking the candidates against the database in batches of doubling size
+    @staticmethod
+    def __filteredSlice(queryset, keys, cut, direction, count):
+        if direction == "forward":
+            index = 0 if cut is None else bisect.bisect_right(keys, cut)
+        else:
+            index = (len(keys) if cut is None else bisect.bisect_left(keys, cut)) - 1
+
+        page, batch = [], count
+        while len(page) < count:
+            if direction == "forward":
+                candidates = keys[index:index + batch]
+                index += batch
+            else:
+                candidates = keys[max(index - batch + 1, 0):max(index + 1, 0)][::-1]
+                index -= batch
+            if not candidates:
+                break
+            kept = set(queryset.filter(pk__in=[pk for rank, pk in candidates]).values_list("pk", flat=True))
+            page += [key for key in candidates if key[1] in kept]
+            batch *= 2
+        return page[:count]
+
+
+class MemorySearchBackend(ScoredSearchBackend):
+    def ranking(self, queryset, search_string, search_mode):
+        return SEARCH_INDEXES[queryset.model._meta.label].ranking(search_string, prefix=search_mode == "fuzzy")
+
+
+class SQLiteSearchBackend(ScoredSearchBackend):
+    def ranking(self, queryset, search_string, search_mode):
+        scores = ftsScores(queryset.model, search_string, prefix=search_mode == "fuzzy")
+        return sorted((score, pk) for pk, score in scores.items())
+
+
+SEARCH_BACKENDS = {
+    "postgres": PostgresSearchBackend(),
+    "memory": MemorySearchBackend(),
+    "sqlite": SQLiteSearchBackend(),
+}
+
+
+def searchBackend():
+    return SEARCH_BACKENDS[settings.SEARCH_BACKEND]
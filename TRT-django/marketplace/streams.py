@@ -0,0 +1,299 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http.cookie import parse_cookie
+from .broadcast import accountEvents, itemEvents, startEventListener
+from .encoding import compactValue
+from .models import Account, Message, Notification
+from importlib import import_module
+from urllib.parse import parse_qs, urlsplit
+import asyncio
+import json
+
+# ----------------------------------------------------------------------
+
+# server-sent events stream of item events (see broadcast.py), served as a
+# plain ASGI application routed in TRT/asgi.py, since Django 3.1 views cannot
+# stream asynchronously
+
+# the stream never touches the database: it only relays what the broadcaster
+# of this process publishes, so any number of open gallery tabs costs no queries
+# until an item actually changes
+
+# comment lines are sent while idle, so proxies (e.g. the Heroku router, which
+# closes connections idle for 55 seconds) keep the connection open
+
+KEEPALIVE_PERIOD = 20
+RECONNECT_DELAY = 5000  # milliseconds, for the browser's EventSource
+
+
+async def itemEventStream(scope, receive, send):
+    if scope["method"] != "GET":
+        await send({"type": "http.response.start", "status": 405, "headers": [(b"allow", b"GET")]})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    startEventListener()
+    queue = itemEvents.subscribe()
+    disconnect = asyncio.ensure_future(waitForDisconnect(receive))
+    next_event = asyncio.ensure_future(queue.get())
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        await sendChunk(send, "retry: " + str(RECONNECT_DELAY) + "\n\n")
+
+        while True:
+            done, pending = await asyncio.wait(
+                [disconnect, next_event], timeout=KEEPALIVE_PERIOD, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                return
+            if next_event in done:
+                event = next_event.result()
+                next_event = asyncio.ensure_future(queue.get())
+                await sendChunk(send, "event: " + event["type"] + "\ndata: " + json.dumps(event) + "\n\n")
+            else:
+                await sendChunk(send, ": keepalive\n\n")
+    finally:
+        itemEvents.unsubscribe(queue)
+        disconnect.cancel()
+        next_event.cancel()
+
+
+async def sendChunk(send, text):
+    await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+
+async def waitForDisconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+# ----------------------------------------------------------------------
+
+# long poll of the notifications of the logged in account, also a plain ASGI
+# application (a Django 3.1 view would hold a worker thread while waiting), for
+# browsers whose socket (see accountSocket) cannot be opened
+
+# the client sends the pk of the most recent notification it has (after, -1 for
+# none), and gets {"latest": pk of the most recent notification (or -1),
+# "count": number of unseen notifications} as soon as it has a newer one, or
+# after settings.NOTIFICATIONS_WAIT_TIMEOUT seconds otherwise, and then fetches
+# the new notifications (getNotificationsRelative) before waiting again
+
+# while waiting, the request is only a queue of the account broadcaster (see
+# broadcast.py) woken by the notifications of its account, so an idle page costs
+# a few indexed lookups per timeout, not two notification queries every few seconds
+
+
+async def notificationWait(scope, receive, send):
+    if scope["method"] != "GET":
+        await sendJSON(send, 405, None, [(b"allow", b"GET")])
+        return
+
+    try:
+        after = int(parse_qs(scope["query_string"].decode()).get("after", ["-1"])[0])
+    except ValueError:
+        await sendJSON(send, 400, None)
+        return
+
+    account_pk = await inThread(sessionAccount, scope)
+    if account_pk is None:
+        await sendJSON(send, 403, None)
+        return
+
+    # subscribed before reading the state, so a notification in between still wakes the poll
+    startEventListener()
+    queue = accountEvents.subscribe(account_pk)
+    disconnect = asyncio.ensure_future(waitForDisconnect(receive))
+    next_event = asyncio.ensure_future(queue.get())
+    try:
+        state = await inThread(notificationState, account_pk)
+        deadline = asyncio.get_event_loop().time() + settings.NOTIFICATIONS_WAIT_TIMEOUT
+        while state["latest"] == after:
+            done, pending = await asyncio.wait(
+                [disconnect, next_event],
+                timeout=deadline - asyncio.get_event_loop().time(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnect in done:
+                return
+            if next_event not in done:
+                break
+            event = next_event.result()
+            next_event = asyncio.ensure_future(queue.get())
+            if event["type"] in ["notification", "reset"]:
+                state = await inThread(notificationState, account_pk)
+        await sendJSON(send, 200, state)
+    finally:
+        accountEvents.unsubscribe(queue)
+        disconnect.cancel()
+        next_event.cancel()
+
+
+def notificationState(account_pk):
+    latest = (
+        Notification.objects.filter(account=account_pk)
+        .order_by("-datetime", "-pk")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    count = Account.objects.filter(pk=account_pk).values_list("unread_notifications", flat=True).first()
+    return {"latest": -1 if latest is None else latest, "count": count or 0}
+
+
+async def sendJSON(send, status, data, headers=()):
+    body = b"" if data is None else json.dumps(data).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"cache-control", b"no-cache"), *headers],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+# ----------------------------------------------------------------------
+
+# WebSocket of the logged in account, also a plain ASGI application, through
+# which the new notifications and received messages of the account are pushed
+# as soon as they are saved (see the account events of broadcast.py), as JSON
+# text frames:
+# {"type": "notification", "notification": ["pk", "datetime", "text", "seen", "url"], "count": unseen notifications}
+# {"type": "message", "message": ["pk", "datetime", "sender pk", "text"]}
+# {"type": "reset"} (events may have been missed, so the client should fetch what is new)
+# (datetimes in epoch milliseconds, as in the compact encodings of encoding.py)
+
+# frames from the client are ignored, and the server (uvicorn) pings the socket
+# to keep it open through proxies
+
+
+async def accountSocket(scope, receive, send):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+
+    # only pages of this site may open the socket with the session cookie of their visitor
+    account_pk = None
+    if sameOrigin(scope):
+        account_pk = await inThread(sessionAccount, scope)
+    if account_pk is None:
+        await send({"type": "websocket.close", "code": 4003})
+        return
+
+    startEventListener()
+    queue = accountEvents.subscribe(account_pk)
+    closed = asyncio.ensure_future(waitForSocketClose(receive))
+    next_event = asyncio.ensure_future(queue.get())
+    try:
+        await send({"type": "websocket.accept"})
+        while True:
+            done, pending = await asyncio.wait([closed, next_event], return_when=asyncio.FIRST_COMPLETED)
+            if closed in done:
+                return
+            event = next_event.result()
+            next_event = asyncio.ensure_future(queue.get())
+            frame = await inThread(accountFrame, account_pk, event)
+            if frame is not None:
+                await send({"type": "websocket.send", "text": json.dumps(frame)})
+    finally:
+        accountEvents.unsubscribe(queue)
+        closed.cancel()
+        next_event.cancel()
+
+
+# frame of an account event, or None if its row no longer exists
+
+
+def accountFrame(account_pk, event):
+    if event["type"] == "notification":
+        notification = (
+            Notification.objects.filter(pk=event["pk"], account=account_pk)
+            .values_list("pk", "datetime", "text", "url")
+            .first()
+        )
+        if notification is None:
+            return None
+        account = Account.objects.filter(pk=account_pk).values_list(
+            "unread_notifications", "notifications_seen_through"
+        ).first()
+        if account is None:
+            return None
+        pk, notification_datetime, text, url = notification
+        count, seen_through = account
+        return {
+            "type": "notification",
+            "notification": [compactValue(value) for value in [pk, notification_datetime, text, pk <= seen_through, url]],
+            "count": count,
+        }
+    if event["type"] == "message":
+        message = (
+            Message.objects.filter(pk=event["pk"], receiver=account_pk)
+            .values_list("pk", "datetime", "sender", "text")
+            .first()
+        )
+        if message is None:
+            return None
+        return {"type": "message", "message": [compactValue(value) for value in message]}
+    return {"type": "reset"}
+
+
+# whether the Origin of a WebSocket handshake is the host it was sent to
+# (browsers send cookies with cross-site handshakes, and WebSockets have no CORS)
+
+
+def sameOrigin(scope):
+    headers = dict(scope["headers"])
+    origin = headers.get(b"origin", b"").decode("latin-1")
+    return origin != "" and urlsplit(origin).netloc == headers.get(b"host", b"").decode("latin-1")
+
+
+async def waitForSocketClose(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+# ----------------------------------------------------------------------
+
+# pk of the account logged in with the session cookie of the request, or None
+
+
+def sessionAccount(scope):
+    cookies = parse_cookie(
+        b"; ".join(value for name, value in scope["headers"] if name == b"cookie").decode("latin-1")
+    )
+    session = import_module(settings.SESSION_ENGINE).SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    username = session.get("username")
+    if username is None:
+        return None
+    return Account.objects.filter(username=username).values_list("pk", flat=True).first()
+
+
+# result of a database function run in a worker thread (not the single thread
+# shared by default, which one slow query would then hold for every stream),
+# handling its connections as a request would
+
+
+async def inThread(function, *args):
+    def run():
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+
+    return await sync_to_async(run, thread_sensitive=False)()
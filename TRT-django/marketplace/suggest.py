@@ -0,0 +1,164 @@
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+import bisect
+import threading
+import time
+
+# ----------------------------------------------------------------------
+
+# per-process prefix index of the names of available items, item requests and
+# categories, for search-as-you-type suggestions without database queries
+
+# every name is indexed under each of its word starts (lowercase), e.g.
+# "Microwave Oven" under "microwave oven" and "oven", in one sorted list of
+# (key, kind, pk) entries, so the completions of a prefix are the contiguous
+# run of entries found by bisection
+
+# the index is loaded on first use and kept up to date with the writes of this
+# process by the model signals (see models.py). Every settings.SUGGESTION_INDEX_REFRESH
+# seconds, one request also reads the writes of other processes since the last
+# refresh: the items and item requests updated since then (see updated_at), the
+# tombstones of those deleted, and the few categories. The catalog is not reloaded
+# whole, and the queries run outside the lock, so the other requests of the process
+# are served from the index meanwhile. If the last refresh is older than the
+# tombstones kept (settings.TOMBSTONE_RETENTION), the index is reloaded instead.
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = []  # sorted (key, kind, pk)
+        self.names = {}    # (kind, pk) -> name
+        self.category_pks = set()
+        self.loaded_at = None
+        self.synced_at = None  # time of the database state last read
+        self.refreshing = False
+
+    # load the whole index on first use, or read the changes since the last refresh if it is too old
+    def refresh(self):
+        with self.lock:
+            if self.loaded_at is None:
+                synced_at = timezone.now()
+                self.__replace(self.__read(None))
+                self.loaded_at, self.synced_at = time.monotonic(), synced_at
+                return
+            if self.refreshing or time.monotonic() - self.loaded_at < settings.SUGGESTION_INDEX_REFRESH:
+                return
+            self.refreshing = True
+            since = self.synced_at - settings.INDEX_REFRESH_MARGIN
+
+        try:
+            synced_at = timezone.now()
+            full = since < synced_at - settings.TOMBSTONE_RETENTION
+            names = self.__read(None if full else since)
+            with self.lock:
+                if full:
+                    self.__replace(names)
+                else:
+                    # every category was read, so those missing were deleted
+                    for pk in self.category_pks - {pk for kind, pk in names if kind == "category"}:
+                        self.__set("category", pk, None)
+                    for (kind, pk), name in names.items():
+                        if self.names.get((kind, pk)) != name:
+                            self.__set(kind, pk, name)
+                self.synced_at = synced_at
+        finally:
+            with self.lock:
+                self.loaded_at = time.monotonic()
+                self.refreshing = False
+
+    # add or rename (name given) or remove (name None) one indexed object
+    # (ignored until the index is loaded, since loading reads the latest names)
+    def update(self, kind, pk, name=None):
+        with self.lock:
+            if self.loaded_at is not None:
+                self.__set(kind, pk, name)
+
+    # up to count distinct names with a word starting with prefix, categories first,
+    # as [{"text", "type"}, ...]
+    def suggest(self, prefix, count):
+        self.refresh()
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+
+        with self.lock:
+            matches = {"category": [], "item": [], "item_request": []}
+            index = bisect.bisect_left(self.entries, (prefix,))
+            while index < len(self.entries) and self.entries[index][0].startswith(prefix):
+                key, kind, pk = self.entries[index]
+                matches[kind].append(self.names[(kind, pk)])
+                index += 1
+
+        suggestions = []
+        seen = set()
+        for kind in ["category", "item", "item_request"]:
+            for name in sorted(matches[kind], key=lambda name: (len(name), name.lower())):
+                if len(suggestions) < count and name.lower() not in seen:
+                    seen.add(name.lower())
+                    suggestions.append({"text": name, "type": kind})
+        return suggestions
+
+    def __set(self, kind, pk, name):
+        old_name = self.names.pop((kind, pk), None)
+        if kind == "category":
+            self.category_pks.discard(pk)
+        if old_name is not None:
+            for key in self.__keys(old_name):
+                index = bisect.bisect_left(self.entries, (key, kind, pk))
+                if index < len(self.entries) and self.entries[index] == (key, kind, pk):
+                    del self.entries[index]
+        if name is not None:
+            self.names[(kind, pk)] = name
+            if kind == "category":
+                self.category_pks.add(pk)
+            for key in self.__keys(name):
+                bisect.insort(self.entries, (key, kind, pk))
+
+    def __replace(self, names):
+        self.names = {key: name for key, name in names.items() if name is not None}
+        self.category_pks = {pk for kind, pk in self.names if kind == "category"}
+        self.entries = sorted(
+            (key, kind, pk) for (kind, pk), name in self.names.items() for key in self.__keys(name)
+        )
+
+    # names of the indexed objects as {(kind, pk): name}, of all of them if since is None,
+    # else of those changed since then (where the name of those removed is None),
+    # and of all categories either way
+    @staticmethod
+    def __read(since):
+        Item = apps.get_model("marketplace", "Item")
+        ItemTombstone = apps.get_model("marketplace", "ItemTombstone")
+        ItemRequest = apps.get_model("marketplace", "ItemRequest")
+        ItemRequestTombstone = apps.get_model("marketplace", "ItemRequestTombstone")
+        Category = apps.get_model("marketplace", "Category")
+
+        names = {}
+        if since is None:
+            items = Item.objects.filter(status=Item.AVAILABLE)
+            item_requests = ItemRequest.objects.all()
+        else:
+            items = Item.objects.filter(updated_at__gt=since)
+            item_requests = ItemRequest.objects.filter(updated_at__gt=since)
+        for pk, status, name in items.values_list("pk", "status", "name"):
+            names[("item", pk)] = name if status == Item.AVAILABLE else None
+        for pk, name in item_requests.values_list("pk", "name"):
+            names[("item_request", pk)] = name
+        if since is not None:
+            for pk in ItemTombstone.objects.filter(datetime__gt=since).values_list("item_pk", flat=True):
+                names[("item", pk)] = None
+            for pk in ItemRequestTombstone.objects.filter(datetime__gt=since).values_list("item_request_pk", flat=True):
+                names[("item_request", pk)] = None
+        for pk, name in Category.objects.values_list("pk", "name"):
+            names[("category", pk)] = name
+        return names
+
+    # index keys of a name: the lowercase name from the start of each word
+    @staticmethod
+    def __keys(name):
+        words = name.lower().split()
+        return {" ".join(words[start:]) for start in range(len(words))}
+
+
+suggestionIndex = SuggestionIndex()
@@ -1,3 +1,754 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
+import asyncio
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from . import views
+from .bm25 import BM25Index
+from .listing_cache import cachedListing, coalesceListingRequests, listingVersion
+from .models import Account, Category, Item, ItemRequest, ItemRequestTombstone, ItemTombstone, Notification
+from .pagination import decodeCursor, encodeCursor
+from .search import RANK_ORDERING, SEARCH_BACKENDS, SEARCH_ORDERING
+from .suggest import SuggestionIndex
 
-# Create your tests here.
+# ----------------------------------------------------------------------
+
+# create count listings (items or item requests) of account with the given name and description
+
+
+def createListings(model, account, count, name, description):
+    fields = {
+        "name": name,
+        "posted_date": timezone.now(),
+        "deadline": timezone.now().date() + timedelta(days=10),
+        "price": Decimal(5),
+        "negotiable": False,
+        "condition": Item.NEW,
+        "description": description,
+        "image": "images/test.jpg",
+    }
+    if model is Item:
+        fields.update(seller=account, status=Item.AVAILABLE)
+    else:
+        fields.update(requester=account)
+    for i in range(count):
+        model.objects.create(**fields)
+
+
+# client logged in as the account with the given username
+
+
+def loggedInClient(username):
+    client = Client()
+    session = client.session
+    session["username"] = username
+    session.save()
+    return client
+
+
+# ----------------------------------------------------------------------
+
+# the signed cursors of the relative retrieval views: the next_cursor of a page
+# resumes right after it, and tampered or expired cursors are rejected
+
+
+class CursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 7, "oak chair", "solid oak chair")
+
+    def getPage(self, position):
+        return Client().get("/items/get_relative/?count=4&direction=backward&fields=name&" + position)
+
+    def testNextPage(self):
+        first = self.getPage("base_item_pk=-1").json()
+        second = self.getPage("cursor=" + first["next_cursor"]).json()
+        pks = [item["pk"] for item in first["items"] + second["items"]]
+        self.assertEqual(pks, sorted(Item.objects.values_list("pk", flat=True), reverse=True))
+
+    def testTamperedCursor(self):
+        cursor = self.getPage("base_item_pk=-1").json()["next_cursor"]
+        tampered = cursor[:-1] + ("A" if cursor[-1] != "A" else "B")
+        self.assertEqual(self.getPage("cursor=" + tampered).status_code, 400)
+
+    def testExpiredCursor(self):
+        cursor = self.getPage("base_item_pk=-1").json()["next_cursor"]
+        later = time.time() + settings.CURSOR_MAX_AGE.total_seconds() + 60
+        with mock.patch("django.core.signing.time.time", return_value=later):
+            self.assertEqual(self.getPage("cursor=" + cursor).status_code, 400)
+
+
+# ----------------------------------------------------------------------
+
+# cached listing queries are served from the cache until a listing write bumps
+# the listing version, after which they are computed again
+
+
+class ListingCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 2, "oak chair", "solid oak chair")
+
+    def testWriteInvalidates(self):
+        computed = []
+
+        def compute():
+            computed.append(Item.objects.count())
+            return computed[-1]
+
+        self.assertEqual(cachedListing("test", ["oak"], compute), 2)
+        self.assertEqual(cachedListing("test", ["oak"], compute), 2)
+        self.assertEqual(len(computed), 1)
+
+        version = listingVersion()
+        item = Item.objects.first()
+        item.name = "pine chair"
+        item.save()
+        self.assertGreater(listingVersion(), version)
+
+        self.assertEqual(cachedListing("test", ["oak"], compute), 2)
+        self.assertEqual(len(computed), 2)
+
+    def testRepeatedRequest(self):
+        client = Client()
+        url = "/items/get_relative/?count=4&direction=backward&base_item_pk=-1&fields=name"
+        client.get(url)
+        with self.assertNumQueries(0):
+            cached = client.get(url)
+        createListings(Item, Account.objects.get(username="tester"), 1, "oak table", "oak table")
+        with CaptureQueriesContext(connection) as queries:
+            fresh = client.get(url)
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(len(fresh.json()["items"]), len(cached.json()["items"]) + 1)
+
+
+# concurrent identical listing requests under ASGI share the response of the first
+# one (without its cookies), while different requests go through on their own
+
+
+class ListingRequestFlightTests(SimpleTestCase):
+    def testCoalescing(self):
+        calls = []
+
+        async def application(scope, receive, send):
+            calls.append(scope["query_string"])
+            await asyncio.sleep(0.01)
+            headers = [(b"content-type", b"application/json"), (b"set-cookie", b"sessionid=first")]
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": scope["query_string"]})
+
+        async def request(coalesced, query_string):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "http", "method": "GET", "path": "/items/get_relative/", "query_string": query_string,
+                     "headers": [(b"accept", b"application/json")]}
+            await coalesced(scope, None, send)
+            return sent
+
+        async def burst():
+            coalesced = coalesceListingRequests(application)
+            return await asyncio.gather(*[request(coalesced, b"count=4") for i in range(5)], request(coalesced, b"count=8"))
+
+        responses = asyncio.run(burst())
+        self.assertEqual(sorted(calls), [b"count=4", b"count=8"])
+        for sent in responses[:5]:
+            self.assertEqual(sent[1]["body"], b"count=4")
+        self.assertIn((b"set-cookie", b"sessionid=first"), responses[0][0]["headers"])
+        for sent in responses[1:5]:
+            self.assertEqual(sent[0]["headers"], [(b"content-type", b"application/json")])
+        self.assertEqual(responses[5][1]["body"], b"count=8")
+
+    def testFailedRequest(self):
+        calls = []
+
+        async def application(scope, receive, send):
+            calls.append(scope["query_string"])
+            await asyncio.sleep(0.01)
+            if len(calls) == 1:
+                raise ValueError
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        async def request(coalesced):
+            sent = []
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "http", "method": "GET", "path": "/items/facets/", "query_string": b"", "headers": []}
+            try:
+                await coalesced(scope, None, send)
+            except ValueError:
+                return None
+            return sent
+
+        async def burst():
+            coalesced = coalesceListingRequests(application)
+            return await asyncio.gather(*[request(coalesced) for i in range(3)])
+
+        first, *others = asyncio.run(burst())
+        self.assertIsNone(first)
+        for sent in others:
+            self.assertEqual(sent[1]["body"], b"ok")
+
+
+# ----------------------------------------------------------------------
+
+# keyset paging of the search backends by rank, through many rows tied on the
+# same rank: every row must come exactly once, whichever the direction, with
+# each page resuming from the cursor of the last row of the previous one
+
+
+class RankPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 25, "oak chair", "solid oak chair")
+        createListings(Item, account, 3, "table", "round table")
+
+    def pageThrough(self, backend, direction, count=4):
+        pks, position = [], None
+        while True:
+            page = backend.rankedPage(Item.objects.all(), "oak chair", "", position, direction, count)
+            if not page:
+                return pks
+            pks += [item.pk for item in page]
+            cursor = encodeCursor(RANK_ORDERING, [page[-1].rank, page[-1].pk])
+            position = decodeCursor(cursor, RANK_ORDERING)
+
+    def checkBackend(self, name):
+        all_pks = set(Item.objects.values_list("pk", flat=True))
+        for direction in ["forward", "backward"]:
+            pks = self.pageThrough(SEARCH_BACKENDS[name], direction)
+            self.assertEqual(len(pks), len(set(pks)), direction + " pages repeat rows")
+            self.assertEqual(set(pks), all_pks, direction + " pages lose rows")
+
+    @skipUnless(connection.vendor == "postgresql", "full text search of PostgreSQL")
+    def testPostgresTies(self):
+        self.checkBackend("postgres")
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 tables of SQLite")
+    def testSQLiteTies(self):
+        self.checkBackend("sqlite")
+
+    # (refreshing the indexes on every search, so they read the rows of this test)
+    @override_settings(SEARCH_INDEX_REFRESH=0)
+    def testMemoryTies(self):
+        self.checkBackend("memory")
+
+
+# the same for the unified search over items and item requests (where only the
+# matching rows are listed)
+
+
+class SearchPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 15, "oak chair", "solid oak chair")
+        createListings(ItemRequest, account, 15, "oak chair", "solid oak chair")
+        createListings(Item, account, 3, "table", "round table")
+
+    def pageThrough(self, backend, direction, count=4):
+        keys, position = [], None
+        querysets = [Item.objects.all(), ItemRequest.objects.all()]
+        while True:
+            page = backend.searchPage(querysets, "oak chair", "", position, direction, count)
+            if not page:
+                return keys
+            keys += [(kind, pk) for rank, kind, pk in page]
+            position = decodeCursor(encodeCursor(SEARCH_ORDERING, page[-1]), SEARCH_ORDERING)
+
+    def checkBackend(self, name):
+        matching = {(0, pk) for pk in Item.objects.filter(name="oak chair").values_list("pk", flat=True)}
+        matching |= {(1, pk) for pk in ItemRequest.objects.values_list("pk", flat=True)}
+        for direction in ["forward", "backward"]:
+            keys = self.pageThrough(SEARCH_BACKENDS[name], direction)
+            self.assertEqual(len(keys), len(set(keys)), direction + " pages repeat rows")
+            self.assertEqual(set(keys), matching, direction + " pages lose rows")
+
+    @skipUnless(connection.vendor == "postgresql", "full text search of PostgreSQL")
+    def testPostgresTies(self):
+        self.checkBackend("postgres")
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 tables of SQLite")
+    def testSQLiteTies(self):
+        self.checkBackend("sqlite")
+
+    # (refreshing the indexes on every search, so they read the rows of this test)
+    @override_settings(SEARCH_INDEX_REFRESH=0)
+    def testMemoryTies(self):
+        self.checkBackend("memory")
+
+
+# ----------------------------------------------------------------------
+
+# an index updated document by document (with arrays built before the updates, and
+# the updated documents scored apart) ranks as an index built from scratch
+# (with MERGE_FRACTION raised, so the arrays are not rebuilt on the way)
+
+
+class BM25IndexTests(SimpleTestCase):
+    TEXTS = {
+        1: "solid oak chair",
+        2: "oak table with four chairs",
+        3: "office chair, black",
+        4: "desk lamp",
+        5: "chair chair chair cushion",
+    }
+
+    @mock.patch("marketplace.bm25.MERGE_FRACTION", 1)
+    def testIncrementalUpdates(self):
+        texts = dict(self.TEXTS)
+        index = BM25Index(lambda since: texts.items())
+        index.ranking("chair")
+
+        updates = {3: "oak office chair", 4: None, 6: "rocking chair in oak", 7: "oak shelf"}
+        for pk, text in updates.items():
+            index.update(pk, text)
+            if text is None:
+                del texts[pk]
+            else:
+                texts[pk] = text
+
+        fresh = BM25Index(lambda since: texts.items())
+        for search_string, prefix in [("chair", False), ("oak", False), ("oak ch", True), ("lamp", False)]:
+            expected = fresh.ranking(search_string, prefix)
+            ranking = index.ranking(search_string, prefix)
+            self.assertEqual([pk for score, pk in ranking], [pk for score, pk in expected])
+            for (score, pk), (expected_score, expected_pk) in zip(ranking, expected):
+                self.assertAlmostEqual(score, expected_score)
+        self.assertEqual(index.changes, len(updates))
+
+    # (where a refresh reads only the documents changed since the last one)
+    @override_settings(SEARCH_INDEX_REFRESH=0)
+    def testRefreshReadsChanges(self):
+        texts, changes, loads = dict(self.TEXTS), {}, []
+
+        def load(since):
+            loads.append(since)
+            return list((texts if since is None else changes).items())
+
+        index = BM25Index(load)
+        index.ranking("chair")
+        changes.update({3: "oak office chair", 4: None, 6: "rocking chair in oak"})
+        for pk, text in changes.items():
+            if text is None:
+                del texts[pk]
+            else:
+                texts[pk] = text
+
+        fresh = BM25Index(lambda since: texts.items())
+        for search_string in ["chair", "oak", "lamp"]:
+            self.assertEqual(
+                [pk for score, pk in index.ranking(search_string)], [pk for score, pk in fresh.ranking(search_string)]
+            )
+        self.assertIsNone(loads[0])
+        self.assertTrue(all(since is not None for since in loads[1:]))
+
+
+# ----------------------------------------------------------------------
+
+# a suggestion index refreshed from the changes in the database (as made by another
+# process, which the index of this process hears nothing about) suggests as a fresh one
+
+
+class SuggestionIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 3, "oak chair", "solid oak chair")
+        createListings(ItemRequest, account, 1, "oak shelf", "oak shelf")
+        Category.objects.create(name="Outdoor", description="outdoor")
+
+    def suggestions(self, index):
+        return sorted((suggestion["type"], suggestion["text"]) for suggestion in index.suggest("o", 10))
+
+    @override_settings(SUGGESTION_INDEX_REFRESH=0)
+    def testRefreshReadsChanges(self):
+        index = SuggestionIndex()
+        self.assertEqual(
+            self.suggestions(index),
+            [("category", "Outdoor"), ("item", "oak chair"), ("item_request", "oak shelf")],
+        )
+
+        renamed, frozen, deleted = Item.objects.order_by("pk")
+        Item.objects.filter(pk=renamed.pk).update(name="oval mirror", updated_at=timezone.now())
+        Item.objects.filter(pk=frozen.pk).update(status=Item.FROZEN, updated_at=timezone.now())
+        deleted.delete()
+        ItemRequest.objects.update(name="old lamp", updated_at=timezone.now())
+        Category.objects.update(name="Office")
+
+        self.assertEqual(
+            self.suggestions(index),
+            [("category", "Office"), ("item", "oval mirror"), ("item_request", "old lamp")],
+        )
+        self.assertEqual(self.suggestions(index), self.suggestions(SuggestionIndex()))
+
+
+# ----------------------------------------------------------------------
+
+# category_pks of the items and item requests follows their categories, whichever
+# side of the m2m relation is changed
+
+
+class CategoryPksTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 2, "oak chair", "solid oak chair")
+        createListings(ItemRequest, account, 1, "oak chair", "solid oak chair")
+        Category.objects.create(name="Furniture", description="furniture")
+        Category.objects.create(name="Wood", description="wood")
+
+    def setUp(self):
+        self.item, self.other = Item.objects.order_by("pk")
+        self.item_request = ItemRequest.objects.get()
+        self.furniture = Category.objects.get(name="Furniture")
+        self.wood = Category.objects.get(name="Wood")
+
+    def categoryPks(self, instance):
+        return sorted(type(instance).objects.get(pk=instance.pk).category_pks)
+
+    def testItemSide(self):
+        self.item.categories.add(self.furniture, self.wood)
+        self.assertEqual(self.categoryPks(self.item), sorted([self.furniture.pk, self.wood.pk]))
+        self.item.categories.remove(self.wood)
+        self.assertEqual(self.categoryPks(self.item), [self.furniture.pk])
+        self.item.categories.clear()
+        self.assertEqual(self.categoryPks(self.item), [])
+
+        self.item_request.categories.add(self.wood)
+        self.assertEqual(self.categoryPks(self.item_request), [self.wood.pk])
+        self.item_request.categories.clear()
+        self.assertEqual(self.categoryPks(self.item_request), [])
+
+    def testCategorySide(self):
+        self.wood.item_set.add(self.item, self.other)
+        self.assertEqual(self.categoryPks(self.item), [self.wood.pk])
+        self.assertEqual(self.categoryPks(self.other), [self.wood.pk])
+        self.wood.item_set.remove(self.other)
+        self.assertEqual(self.categoryPks(self.other), [])
+        self.wood.item_set.clear()
+        self.assertEqual(self.categoryPks(self.item), [])
+
+    def testDeletedCategory(self):
+        self.item.categories.add(self.furniture, self.wood)
+        self.wood.delete()
+        self.assertEqual(self.categoryPks(self.item), [self.furniture.pk])
+
+
+# ----------------------------------------------------------------------
+
+# the item changes feed returns the items edited since the watermark, and the pks of
+# the items frozen or deleted (tombstoned) since then
+
+
+@mock.patch.object(views, "CHANGES_WATERMARK_MARGIN", timedelta(0))
+class ItemChangesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 4, "oak chair", "solid oak chair")
+
+    def getChanges(self, since=None):
+        url = "/items/changes/?fields=name"
+        if since is not None:
+            url += "&since=" + since
+        response = Client().get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def testChangesSince(self):
+        since = self.getChanges()["since"]
+        edited, frozen, deleted, untouched = Item.objects.order_by("pk")
+        edited.name = "pine chair"
+        edited.save()
+        frozen.status = Item.FROZEN
+        frozen.save()
+        deleted_pk = deleted.pk
+        deleted.delete()
+
+        changes = self.getChanges(since)
+        self.assertEqual(changes["items"], [{"pk": edited.pk, "name": "pine chair"}])
+        self.assertEqual(sorted(changes["removed"]), sorted([frozen.pk, deleted_pk]))
+        self.assertFalse(changes["reset"])
+
+        changes = self.getChanges(changes["since"])
+        self.assertEqual((changes["items"], changes["removed"]), ([], []))
+
+    def testExpiredWatermark(self):
+        since = self.getChanges()["since"]
+        later = timezone.now() + settings.TOMBSTONE_RETENTION * 2
+        with mock.patch.object(views.timezone, "now", lambda: later):
+            self.assertTrue(self.getChanges(since)["reset"])
+
+
+# the expired items maintenance forgets the tombstones older than the retention
+
+
+class DeleteExpiredTests(TestCase):
+    def testOldTombstonesPruned(self):
+        now = timezone.now()
+        for age in [timedelta(0), settings.TOMBSTONE_RETENTION * 2]:
+            ItemTombstone.objects.create(item_pk=1, datetime=now - age)
+            ItemRequestTombstone.objects.create(item_request_pk=1, datetime=now - age)
+
+        views.deleteExpired.now()
+        self.assertEqual(list(ItemTombstone.objects.values_list("datetime", flat=True)), [now])
+        self.assertEqual(list(ItemRequestTombstone.objects.values_list("datetime", flat=True)), [now])
+
+
+# ----------------------------------------------------------------------
+
+# every facet count is the number of available items the gallery would show with
+# that filter also checked, i.e. the count() of the filtered items
+
+
+class ItemFacetsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        furniture = Category.objects.create(name="Furniture", description="furniture")
+        wood = Category.objects.create(name="Wood", description="wood")
+        Category.objects.create(name="Books", description="books")
+        createListings(Item, account, 6, "oak chair", "solid oak chair")
+        items = list(Item.objects.order_by("pk"))
+        for i, item in enumerate(items):
+            item.condition = [Item.NEW, Item.LIKE_NEW, Item.POOR][i % 3]
+            item.status = Item.FROZEN if i == 5 else Item.AVAILABLE
+            item.save()
+        for item in items[:4]:
+            item.categories.add(furniture)
+        for item in items[2:]:
+            item.categories.add(wood)
+
+    def getFacets(self, query=""):
+        response = Client().get("/items/facets/" + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def checkFacets(self, condition_indexes, category_pks):
+        query = "?condition_indexes=" + ",".join(str(index) for index in condition_indexes)
+        query += "&category_pks=" + ",".join(str(pk) for pk in category_pks)
+        facets = self.getFacets(query)
+
+        available = Item.objects.filter(status=Item.AVAILABLE)
+        by_condition = available.filter(condition__in=condition_indexes) if condition_indexes else available
+        by_category = available.filter(category_pks__overlap=category_pks) if category_pks else available
+        self.assertEqual(facets["total"], by_condition.filter(pk__in=by_category).count())
+        for category in Category.objects.all():
+            count = by_condition.filter(category_pks__contains=[category.pk]).count()
+            self.assertEqual(facets["categories"][str(category.pk)], count)
+        for condition in Item.CONDITIONS:
+            count = by_category.filter(condition=condition["index"]).count()
+            self.assertEqual(facets["conditions"][str(condition["index"])], count)
+
+    def testCounts(self):
+        furniture = Category.objects.get(name="Furniture")
+        wood = Category.objects.get(name="Wood")
+        self.checkFacets([], [])
+        self.checkFacets([Item.NEW], [])
+        self.checkFacets([], [furniture.pk])
+        self.checkFacets([Item.NEW, Item.POOR], [wood.pk])
+        self.checkFacets([Item.LIKE_NEW], [furniture.pk, wood.pk])
+
+    # the facets count the items of every category, so renaming, adding or deleting one changes their ETag
+    def testCategoriesChangeETag(self):
+        client = Client()
+        etag = client.get("/items/facets/")["ETag"]
+        self.assertEqual(client.get("/items/facets/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        books = Category.objects.get(name="Books")
+        books.name = "Old books"
+        changes = [
+            books.save,
+            lambda: Category.objects.create(name="Lamps", description="lamps"),
+            lambda: Category.objects.filter(name="Lamps").delete(),
+        ]
+        for change in changes:
+            change()
+            response = client.get("/items/facets/", HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+
+
+# ----------------------------------------------------------------------
+
+# the items and item requests of an account change (for the delta feed and the
+# feed ETags) when its contact or email changes, and only then
+
+
+class AccountItemsTouchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 2, "oak chair", "solid oak chair")
+        createListings(ItemRequest, account, 2, "oak chair", "solid oak chair")
+
+    def setUp(self):
+        self.account = Account.objects.get(username="tester")
+
+    def updatedAt(self):
+        return (
+            list(Item.objects.order_by("pk").values_list("updated_at", flat=True)),
+            list(ItemRequest.objects.order_by("pk").values_list("updated_at", flat=True)),
+        )
+
+    def testOtherFieldsLeaveItems(self):
+        before = self.updatedAt()
+        self.account.remind_set_email_settings = False
+        self.account.save(update_fields=["remind_set_email_settings"])
+        self.account.email_activity = True
+        self.account.save()
+        Account.objects.get(pk=self.account.pk).save()
+        self.assertEqual(self.updatedAt(), before)
+
+    def testContactTouchesItems(self):
+        before = self.updatedAt()
+        self.account.contact = "555-0100"
+        self.account.save()
+        after = self.updatedAt()
+        for old, new in zip(before[0] + before[1], after[0] + after[1]):
+            self.assertLess(old, new)
+
+
+# ----------------------------------------------------------------------
+
+# the gallery and item request page sorts use their indexes (see explain_sorts)
+
+
+class SortIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        createListings(Item, account, 10, "oak chair", "solid oak chair")
+        createListings(ItemRequest, account, 10, "oak chair", "solid oak chair")
+
+    def testSortsUseIndexes(self):
+        call_command("explain_sorts", count=4, stdout=StringIO())
+
+    # (with another page size than above, so SQLite does not answer with the plans
+    # of the statements it cached before the index was dropped)
+    def testUnindexedSortFails(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX itemrequest_price_idx")
+        with self.assertRaisesMessage(CommandError, "item requests, price_hightolow, forward"):
+            call_command("explain_sorts", count=3, stdout=StringIO())
+
+
+# ----------------------------------------------------------------------
+
+# the unread notifications counter of an account goes up with every new notification,
+# and down as they are seen or deleted while unseen
+
+
+class NotificationCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+
+    def setUp(self):
+        self.account = Account.objects.get(username="tester")
+        self.client = loggedInClient("tester")
+
+    def unread(self):
+        count = self.client.get("/notifications/count/").json()["count"]
+        self.assertEqual(count, Notification.objects.filter(Notification.UNSEEN, account=self.account).count())
+        return count
+
+    def testCounter(self):
+        self.assertEqual(self.unread(), 0)
+        for i in range(3):
+            views.notify(self.account, "notification " + str(i), "/")
+        self.assertEqual(self.unread(), 3)
+
+        Notification.objects.filter(account=self.account).order_by("pk").last().delete()
+        self.assertEqual(self.unread(), 2)
+
+        self.assertEqual(self.client.get("/notifications/see/").status_code, 200)
+        self.assertEqual(self.unread(), 0)
+        views.notify(self.account, "notification 3", "/")
+        self.assertEqual(self.unread(), 1)
+
+
+# seeing notifications through a pk moves the seen watermark of the account to it
+# (only forward, and only to one of its own notifications) and takes the newly seen
+# ones off the counter
+
+
+class SeeNotificationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        other = Account.objects.create(username="other", name="other", email="other@princeton.edu")
+        for i in range(4):
+            views.notify(account, "notification " + str(i), "/")
+        views.notify(other, "notification", "/")
+
+    def setUp(self):
+        self.client = loggedInClient("tester")
+        self.pks = list(Notification.objects.filter(account__username="tester").order_by("pk").values_list("pk", flat=True))
+
+    def see(self, through):
+        return self.client.get("/notifications/see/?through=" + str(through)).status_code
+
+    def assertSeenThrough(self, through, unread):
+        account = Account.objects.get(username="tester")
+        self.assertEqual(account.notifications_seen_through, through)
+        self.assertEqual(account.unread_notifications, unread)
+
+    def testWatermark(self):
+        self.assertEqual(self.see(self.pks[1]), 200)
+        self.assertSeenThrough(self.pks[1], 2)
+
+        # never moved back
+        self.assertEqual(self.see(self.pks[0]), 200)
+        self.assertSeenThrough(self.pks[1], 2)
+
+        # nor to a notification of another account
+        other_pk = Notification.objects.get(account__username="other").pk
+        self.assertEqual(self.see(other_pk), 200)
+        self.assertSeenThrough(self.pks[1], 2)
+
+        self.assertEqual(self.see("x"), 400)
+        self.assertEqual(self.see(self.pks[3]), 200)
+        self.assertSeenThrough(self.pks[3], 0)
+        self.assertEqual(Notification.objects.filter(Notification.UNSEEN, account__username="tester").count(), 0)
+
+
+# the next_cursor of the notifications bootstrap resumes the relative retrieval backward
+# right after the notifications it returned
+
+
+class BootstrapNotificationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = Account.objects.create(username="tester", name="tester", email="tester@princeton.edu")
+        for i in range(5):
+            views.notify(account, "notification " + str(i), "/")
+
+    def testCursor(self):
+        client = loggedInClient("tester")
+        pks = list(Notification.objects.order_by("-datetime", "-pk").values_list("pk", flat=True))
+
+        bootstrap = client.get("/notifications/bootstrap/?count=2").json()
+        self.assertEqual(bootstrap["count"], 5)
+        self.assertEqual([row[0] for row in bootstrap["notifications"]], pks[:2])
+
+        page = client.get(
+            "/notifications/get_relative/", {"count": 2, "direction": "backward", "cursor": bootstrap["next_cursor"]}
+        ).json()
+        self.assertEqual([row[0] for row in page["notifications"]], pks[2:4])
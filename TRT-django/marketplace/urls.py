@@ -4,11 +4,15 @@ from . import views
 urlpatterns = [
     path("", views.gallery, name="gallery"),
     path("items/get_relative/", views.getItemsRelative, name="get_items_relative"),
+    path("items/changes/", views.getItemChanges, name="get_item_changes"),
+    path("items/facets/", views.getItemFacets, name="get_item_facets"),
+    path("items/suggest/", views.getSuggestions, name="get_suggestions"),
     path("items/list/", views.listItems, name="list_items"),
     path("items/new/", views.newItem, name="new_item"),
     path("items/<int:pk>/edit/", views.editItem, name="edit_item"),
     path("items/<int:pk>/delete/", views.deleteItem, name="delete_item"),
     path("items/<int:pk>/page/", views.pageItem, name="page_item"),
+    path("items/<int:pk>/card/", views.getItemCard, name="get_item_card"),
     path("purchases/list/", views.listPurchases, name="list_purchases"),
     path("purchases/new/", views.newPurchase, name="new_purchase"),
     path("purchases/<int:pk>/confirm/", views.confirmPurchase, name="confirm_purchase"),
@@ -37,10 +41,13 @@ urlpatterns = [
         "item_requests/browse/", views.browseItemRequests, name="browse_item_requests"
     ),
     path("item_requests/get_relative/", views.getItemRequestsRelative, name="get_item_requests_relative"),
+    path("item_requests/<int:pk>/card/", views.getItemRequestCard, name="get_item_request_card"),
+    path("search/", views.getSearchResults, name="get_search_results"),
     path("notifications/list/", views.listNotifications, name="list_notifications"),
     path("notifications/get/", views.getNotifications, name="get_notifications"),
     path("notifications/get_relative/", views.getNotificationsRelative, name="get_notifications_relative"),
     path("notifications/count/", views.countNotifications, name="count_notifications"),
+    path("notifications/bootstrap/", views.bootstrapNotifications, name="bootstrap_notifications"),
     path("notifications/see/", views.seeNotifications, name="see_notifications"),
     path("account/activity/", views.accountActivity, name="account_activity"),
     path("account/edit/", views.editAccount, name="edit_account"),
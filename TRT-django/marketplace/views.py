@@ -1,9 +1,7 @@
 from django.shortcuts import render, redirect
 from django.urls import reverse
 from django.contrib import messages
-from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
-from django.db.models import Window, F, prefetch_related_objects, Q
-from django.db.models.functions import RowNumber
+from django.db.models import prefetch_related_objects, Count, Exists, F, Max, OuterRef, Prefetch, Q, Subquery
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.files.storage import default_storage
 from django.core.mail import send_mail
@@ -24,12 +22,31 @@ from .models import (
     Category,
     ItemFlag,
     ItemRequestFlag,
+    ItemTombstone,
+    ItemRequestTombstone,
 )
 from .forms import AccountForm, ItemForm, ItemRequestForm, ItemFlagForm, ItemRequestFlagForm
+from .pagination import keysetPosition, keysetPage, encodeCursor, decodeCursor, nextCursor, encodeWatermark, decodeWatermark
+from .search import RANK_ORDERING, SEARCH_ORDERING, SEARCH_MODES, searchBackend
+from .listing_cache import normalizeListingQuery, cachedListing
+from .suggest import suggestionIndex
+from .encoding import feedEncoding, isCompact, columns, feedResponse
+from .conditional import (
+    itemPageETag,
+    itemRequestPageETag,
+    itemCardETag,
+    itemRequestCardETag,
+    itemsFeedETag,
+    itemFacetsETag,
+    itemRequestsFeedETag,
+    searchFeedETag,
+)
 from utils import CASClient
 from datetime import timedelta
 
 from django.core.exceptions import PermissionDenied
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag
 import secrets
 from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
 import json
@@ -116,8 +133,7 @@ def send_mail_activity(subject, body, senderEmail, receiverAccounts, fail_silent
 
 @background(schedule=300)
 def notifyEmailSparsely(pk, email, url):
-    notification = Notification.objects.get(pk=pk)
-    if not notification.seen:
+    if Notification.objects.filter(Notification.UNSEEN, pk=pk).exists():
         send_mail(
             "Unread Notification(s) on Tiger ReTail",
             "You have new notification(s) waiting to be read.\n" + url + "\n\nYou can change your email notification settings here: https://retail.tigerapps.org/account/edit/",
@@ -136,21 +152,20 @@ def notify(account, text, url, sparse=False, timeout=timedelta(minutes=5)):
     
     # if sparse and recent unseen notification with same text already exists, do nothing
     if sparse:
-        if Notification.objects.filter(account=account, text=text, seen=False).exists():
+        if Notification.objects.filter(Notification.UNSEEN, account=account, text=text).exists():
             duplicates = Notification.objects.filter(
-                account=account, text=text, seen=False
+                Notification.UNSEEN, account=account, text=text
             )
             recent = duplicates.order_by("-datetime").first()
             if timezone.now() < recent.datetime + timeout:
                 return
 
     # otherwise, should notify and schedule an email if first unseen notification
-    should_email = not Notification.objects.filter(account=account, seen=False).exists()
+    should_email = not Notification.objects.filter(Notification.UNSEEN, account=account).exists()
     notification = Notification(
         account=account,
         datetime=timezone.now(),
         text=text,
-        seen=False,
         url=url,
     )
     notification.save()
@@ -382,13 +397,132 @@ def gallery(request):
 
 # ----------------------------------------------------------------------
 
+# item "card" projection: the item data shown by the gallery, as JSON
+
+# card querysets load only the model fields of the requested card fields (all by
+# default), joined with the seller's contact/email if requested, so a page of
+# cards costs one query plus one for all of its album images if requested
+# (instead of one more query for the seller of every item)
+
+# card fields (keys of the card besides "pk"), with the model fields each is loaded from
+ITEM_CARD_FIELDS = {
+    "name": ["name"],
+    "posted_date": ["posted_date"],
+    "deadline": ["deadline"],
+    "price": ["price"],
+    "negotiable": ["negotiable"],
+    "condition_index": ["condition"],
+    "description": ["description"],
+    "image": ["image"],
+    "album": [],
+    "contact": ["seller__contact"],
+    "email": ["seller__email"],
+}
+
+ITEM_CARD_VALUES = {
+    "name": lambda item: item.name,
+    "posted_date": lambda item: item.posted_date.astimezone().strftime("%b. %-d, %Y, %-I:%M %p") + " ET",
+    "deadline": lambda item: item.deadline.strftime("%b. %-d, %Y"),
+    "price": lambda item: item.price,
+    "negotiable": lambda item: item.negotiable,
+    "condition_index": lambda item: str(item.condition),
+    "description": lambda item: item.description,
+    "image": lambda item: item.image.url,
+    "album": lambda item: [albumimage.image.url for albumimage in item.album.all()],
+    "contact": lambda item: item.seller.contact,
+    "email": lambda item: item.seller.email,
+}
+
+
+# extra_fields are other model fields to load, e.g. those of the sort ordering
+
+
+def itemCardQuerySet(items, fields=ITEM_CARD_FIELDS, extra_fields=()):
+    only = ["pk", *extra_fields]
+    for field in fields:
+        only += ITEM_CARD_FIELDS[field]
+    if "contact" in fields or "email" in fields:
+        items = items.select_related("seller")
+        only.append("seller")
+    return items.only(*only)
+
+
+# gets the album image urls of a list of card items in one query (if requested)
+
+
+def prefetchItemCardAlbums(items, fields=ITEM_CARD_FIELDS):
+    if "album" in fields:
+        prefetch_related_objects(items, Prefetch("album", queryset=AlbumImage.objects.only("image", "item")))
+
+
+def itemCard(item, fields=ITEM_CARD_FIELDS):
+    card = {"pk": item.pk}
+    for field in fields:
+        card[field] = ITEM_CARD_VALUES[field](item)
+    return card
+
+
+# compact card values (see encoding.py), where they differ from the above
+ITEM_CARD_COMPACT_VALUES = {
+    "posted_date": lambda item: item.posted_date,
+    "deadline": lambda item: item.deadline,
+    "condition_index": lambda item: item.condition,
+}
+
+
+# card as a row of compact values (pk first, then the fields), for the columnar feeds
+
+
+def itemCardRow(item, fields=ITEM_CARD_FIELDS):
+    return [item.pk] + [ITEM_CARD_COMPACT_VALUES.get(field, ITEM_CARD_VALUES[field])(item) for field in fields]
+
+
+# card fields requested by the fields GET option ("field,field,..."), in card order,
+# or all card fields if not given, or None if any is unknown
+
+
+def parseCardFields(request, card_fields):
+    if "fields" not in request.GET:
+        return list(card_fields)
+    fields = [field for field in request.GET["fields"].split(",") if field]
+    if any(field not in card_fields for field in fields):
+        return None
+    return [field for field in card_fields if field in fields]
+
+
+# ----------------------------------------------------------------------
+
+# get the card of one available item, e.g. to fill in the details of a compact
+# gallery card once it is expanded
+# [OPTIONAL] fields ("field,field,..." of the card fields, see ITEM_CARD_FIELDS; all if not given)
+
+
+@cache_control(no_cache=True)
+@etag(itemCardETag)
+def getItemCard(request, pk):
+    fields = parseCardFields(request, ITEM_CARD_FIELDS)
+    if fields is None:
+        return HttpResponse(status=400)
+
+    item = itemCardQuerySet(Item.objects.filter(pk=pk, status=Item.AVAILABLE), fields).first()
+    if item is None:
+        return HttpResponse(status=400)
+
+    prefetchItemCardAlbums([item], fields)
+    return JsonResponse(itemCard(item, fields))
+
+
+# ----------------------------------------------------------------------
+
 # get AVAILABLE items for image gallery with the following relative GET options:
 # [REQUIRED] count >= 1 (if n < count items fit the criteria, then only those n items returned)      
 # [REQUIRED] direction (forward/backward)
-# [REQUIRED] base_item_pk (if -1, then will collect items from beginning/end based on direction)
+# [REQUIRED] cursor (next_cursor of a previous response) or base_item_pk (if -1, then will collect items from beginning/end based on direction)
 # [OPTIONAL] search_string (used to index the items by name and description prior to retrieval)
 # [OPTIONAL] condition_indexes ("condition_index,condition_index,...")
 # [OPTIONAL] category_pks ("category_pk,category_pk,...")
+# [OPTIONAL] search_mode ("" for plain full text search, or "fuzzy" to also match word prefixes and typos)
+# [OPTIONAL] fields ("field,field,..." of the card fields to return, see ITEM_CARD_FIELDS; all if not given)
 
 # if base_item_pk == -1 and no items yet exist, then returns empty list
 
@@ -420,24 +554,61 @@ def gallery(request):
 #           "album", (list of urls)
 #        },
 #        ...
-#    ]
+#    ],
+#    "next_cursor", (resumes after the last item, with the same query options)
 # }
 
+# sort types for items and item requests, as keyset orderings (see pagination.py)
+# ties are broken by pk in the same direction as the sort key, so that one
+# composite (sort key, pk) index serves both directions of every sort
+SORT_ORDERINGS = {
+    "price_hightolow": [("price", True), ("pk", True)],
+    "price_lowtohigh": [("price", False), ("pk", False)],
+    "date_oldtorec": [("posted_date", False), ("pk", False)],
+    "date_rectoold": [("posted_date", True), ("pk", True)],
+}
+
 
+@cache_control(no_cache=True)
+@etag(itemsFeedETag)
 def getItemsRelative(request):
     try:
         count = int(request.GET['count'])
         direction = request.GET['direction']
-        base_item_pk = int(request.GET['base_item_pk'])
+        base_item_pk = int(request.GET.get('base_item_pk', -1))
     except:
         return HttpResponse(status=400)
 
-    if count < 1 or base_item_pk < -1 or (base_item_pk != -1 and not Item.objects.filter(pk=base_item_pk).exists()) or direction not in ['forward', 'backward']:
+    if count < 1 or base_item_pk < -1 or direction not in ['forward', 'backward']:
+        return HttpResponse(status=400)
+
+    query = parseListingQuery(request)
+    fields = parseCardFields(request, ITEM_CARD_FIELDS)
+    if query is None or fields is None:
+        return HttpResponse(status=400)
+
+    # compact encodings (see encoding.py) are opted into with the Accept header
+    encoding = feedEncoding(request)
+    compact = isCompact(encoding)
+
+    # serve repeated identical queries (e.g. many galleries polling the same search) from the listing cache
+    result = cachedListing(
+        "items",
+        [count, direction, base_item_pk, request.GET.get("cursor"), fields, compact, *query],
+        lambda: queryItemsRelative(count, direction, base_item_pk, request.GET.get("cursor"), fields, compact, *query),
+    )
+    if result is None:
         return HttpResponse(status=400)
+    return feedResponse(encoding, result)
 
+
+# normalized [search_string, condition_indexes, category_pks, sort_type, search_mode]
+# of the optional query options of the listing views, or None if malformed
+# (see normalizeListingQuery)
+def parseListingQuery(request):
     search_string = ""
     condition_indexes = []
-    categories = []
+    category_pks = []
     sort_type = ""
 
     if "search_string" in request.GET:
@@ -447,105 +618,234 @@ def getItemsRelative(request):
         try:
             condition_indexes = [int(pk) for pk in request.GET["condition_indexes"].split(",") if pk]
         except:
-            return HttpResponse(status=400)
+            return None
 
     if "category_pks" in request.GET:
         try:
-            categories = Category.objects.filter(pk__in=[int(pk) for pk in request.GET["category_pks"].split(",") if pk])
+            category_pks = [int(pk) for pk in request.GET["category_pks"].split(",") if pk]
         except:
-            return HttpResponse(status=400)
+            return None
+
+    if "sort_type" in request.GET:
+        sort_type = request.GET["sort_type"]
+
+    search_mode = request.GET.get("search_mode", "")
+    if search_mode not in SEARCH_MODES:
+        return None
+
+    return normalizeListingQuery(search_string, condition_indexes, category_pks, sort_type, search_mode)
+
 
+# ----------------------------------------------------------------------
+
+# helper method to query items for getItemsRelative (see above)
+# returns the JSON response data, or None if the cursor or base item is invalid
+
+
+def queryItemsRelative(count, direction, base_item_pk, cursor, fields, compact, search_string, condition_indexes, category_pks, sort_type, search_mode):
     # filter items that meet conditions and categories criteria
     items = Item.objects.filter(status=Item.AVAILABLE)
 
     if condition_indexes:
         items = items.filter(condition__in=condition_indexes)
 
-    if categories:
-        items = items.filter(categories__in=categories)
-        items = Item.objects.filter(pk__in=items) # get rid of duplicate rows (can happen because of filtering on m2m categories table)
+    if category_pks:
+        items = items.filter(category_pks__overlap=category_pks) # in any of the categories (denormalized, so no m2m join or duplicate rows)
 
     # sort items by price or date if requested
-    order_by = ""
-    if "sort_type" in request.GET:
-        sort_type = request.GET["sort_type"]
+    if sort_type in SORT_ORDERINGS:
+        ordering = SORT_ORDERINGS[sort_type]
 
-        # items = sortMyItems(sort_type, items)
-
-        if sort_type == "price_hightolow":
-            order_by = [F("price").asc(), F("pk").asc()]
-        elif sort_type == "price_lowtohigh":
-            order_by=[F("price").desc(), F("pk").asc()]
-        elif sort_type == "date_oldtorec":
-            order_by=[F("posted_date").desc(), F("pk").asc()]
-        elif sort_type == "date_rectoold":
-            order_by=[F("posted_date").asc(), F("pk").asc()]
-
-    if order_by != "":
-        items = items.annotate(
-            row=Window(
-                expression=RowNumber(),
-                order_by=order_by, 
-            )
-        )
-    
-    # default sort
+    # default sort by search string rank (see the search backends in search.py)
+    # (with no search string every rank is equal, so the pk alone gives the same order)
+    elif search_string:
+        ordering = RANK_ORDERING
     else:
-        # annotate items by search string rank
-        items = items.annotate(rank=SearchRank(SearchVector("name", "description"), SearchQuery(search_string), cover_density=True))
-
-        # annotate items by row number after sorting by search string rank (so no comparison issues with equal ranks)
-        items = items.annotate(
-            row=Window(
-                expression=RowNumber(),
-                order_by=[F("rank").asc(), F("pk").asc()], # also order by unique pk to make tie-breaks consistent
-            )
-        )
+        ordering = [("pk", True)]
+
+    # find the sort position to resume from (carried by the cursor, else that of the base item),
+    # then get the correct slice of items after it
+    position = None
+    if cursor is not None:
+        position = decodeCursor(cursor, ordering)
+        if position is None:
+            return None
+    elif base_item_pk != -1:
+        if ordering == RANK_ORDERING:
+            position = searchBackend().rankPosition(Item.objects.all(), base_item_pk, search_string, search_mode)
+        else:
+            position = keysetPosition(Item.objects.all(), ordering, base_item_pk)
+        if position is None:
+            return None
+
+    # load only the requested card fields (and the sort fields, for the next cursor)
+    items = itemCardQuerySet(items, fields, [field for field, ascending in ordering if field not in ["pk", "rank"]])
 
-    # get the correct slice of items
-    if base_item_pk == -1:
-        items = items.order_by('row' if direction == 'forward' else '-row')[:count]
+    if ordering == RANK_ORDERING:
+        items = searchBackend().rankedPage(items, search_string, search_mode, position, direction, count)
     else:
-        # filter out items based on base_item
-        sign = ">" if direction == "forward" else "<"
-        order = "ASC" if direction == "forward" else "DESC"
-
-        # django does not allow filtering after window function, so will use raw SQL
-        sql, params = items.query.sql_with_params()
-        items = Item.objects.raw("""
-                SELECT * FROM ({}) AS items_with_rows
-                WHERE row {} (
-                    SELECT row FROM ({}) AS base_item_row
-                    WHERE id = %s
-                )
-                ORDER BY row {}
-                LIMIT %s
-            """.format(sql, sign, sql, order), # must order results here, since cannot order RawQuerySet
-            [*params, *params, base_item_pk, count],
-        )
+        items = list(keysetPage(items, ordering, position, direction, count))
 
-    prefetch_related_objects(items, "album") # only 1 query to get all album objects
+    prefetchItemCardAlbums(items, fields) # only 1 query to get all album objects
 
-    return JsonResponse(
-        {
-            "items": [
-                {
-                    "pk": item.pk,
-                    "name": item.name,
-                    "posted_date": item.posted_date.astimezone().strftime("%b. %-d, %Y, %-I:%M %p") + " ET",
-                    "deadline": item.deadline.strftime("%b. %-d, %Y"),
-                    "price": item.price,
-                    "negotiable": item.negotiable,
-                    "condition_index": item.condition,
-                    "description": item.description,
-                    "image": item.image.url,
-                    "album": [albumimage.image.url for albumimage in item.album.all()],
-                    "contact": item.seller.contact,
-                    "email": item.seller.email,
-                } for item in items
-            ]
+    if compact:
+        return {
+            "items": columns(["pk", *fields], [itemCardRow(item, fields) for item in items]),
+            "next_cursor": nextCursor(ordering, items, position),
         }
+    return {
+        "items": [itemCard(item, fields) for item in items],
+        "next_cursor": nextCursor(ordering, items, position),
+    }
+
+
+# ----------------------------------------------------------------------
+
+# get the number of available items in each category and condition, for the
+# gallery filters, with the same query options as getItemsRelative
+# [OPTIONAL] search_string (if given, only items matching it are counted)
+# [OPTIONAL] condition_indexes ("condition_index,condition_index,...")
+# [OPTIONAL] category_pks ("category_pk,category_pk,...")
+# [OPTIONAL] search_mode ("" for plain full text search, or "fuzzy" to also match word prefixes and typos)
+
+# the filters within a facet are alternatives (an item in any of the selected
+# categories is shown), so the category counts ignore the selected categories
+# and the condition counts ignore the selected conditions, i.e. each count is
+# the number of items the gallery would show if that filter were also checked
+
+# returns:
+# {
+#    "categories": {category_pk: count, ...},
+#    "conditions": {condition_index: count, ...},
+#    "total", (number of items matching all the options)
+# }
+
+
+@cache_control(no_cache=True)
+@etag(itemFacetsETag)
+def getItemFacets(request):
+    query = parseListingQuery(request)
+    if query is None:
+        return HttpResponse(status=400)
+
+    # drawing the filters on every gallery load stays cheap, and is recomputed after any listing change
+    return JsonResponse(cachedListing("facets", query, lambda: queryItemFacets(*query)))
+
+
+def queryItemFacets(search_string, condition_indexes, category_pks, sort_type, search_mode):
+    items = Item.objects.filter(status=Item.AVAILABLE)
+    if search_string:
+        items = searchBackend().filterMatching(items, search_string, search_mode)
+
+    condition_filter = Q(condition__in=condition_indexes) if condition_indexes else Q()
+    category_filter = Q(category_pks__overlap=category_pks) if category_pks else Q()
+
+    # every count is a filtered aggregate of the same single scan of the matching items
+    counts = {"total": Count("pk", filter=condition_filter & category_filter)}
+    for category_pk in Category.objects.values_list("pk", flat=True):
+        counts["category_" + str(category_pk)] = Count(
+            "pk", filter=Q(category_pks__contains=[category_pk]) & condition_filter
+        )
+    for condition in Item.CONDITIONS:
+        counts["condition_" + str(condition["index"])] = Count(
+            "pk", filter=Q(condition=condition["index"]) & category_filter
+        )
+    counts = items.aggregate(**counts)
+
+    return {
+        "categories": {
+            int(name[len("category_"):]): count for name, count in counts.items() if name.startswith("category_")
+        },
+        "conditions": {
+            int(name[len("condition_"):]): count for name, count in counts.items() if name.startswith("condition_")
+        },
+        "total": counts["total"],
+    }
+
+
+# ----------------------------------------------------------------------
+
+# get search-as-you-type suggestions: names of categories, available items and
+# item requests with a word starting with q, served from the in-memory prefix
+# index of this process (see suggest.py), so keystrokes never query the database
+# [REQUIRED] q (the search string typed so far)
+# [OPTIONAL] count (1 to 20, default 10)
+
+# returns:
+# {
+#    "suggestions": [{"text", "type" (category/item/item_request)}, ...],
+# }
+
+MAX_SUGGESTIONS = 20
+
+
+def getSuggestions(request):
+    try:
+        q = request.GET["q"]
+        count = int(request.GET.get("count", 10))
+    except:
+        return HttpResponse(status=400)
+
+    if count < 1 or count > MAX_SUGGESTIONS:
+        return HttpResponse(status=400)
+
+    return JsonResponse({"suggestions": suggestionIndex.suggest(q, count)})
+
+
+# ----------------------------------------------------------------------
+
+# get the changes to items since a watermark, so that idle galleries can poll
+# with one indexed range scan instead of re-running the gallery query
+# [OPTIONAL] since (the "since" of a previous response; if missing, only returns a new watermark)
+# [OPTIONAL] fields ("field,field,..." of the card fields to return, see ITEM_CARD_FIELDS; all if not given)
+
+# returns:
+# {
+#    "items": [cards (see getItemsRelative) of AVAILABLE items created or edited since the watermark],
+#    "removed": [pks of items deleted, frozen or completed since the watermark],
+#    "since": watermark for the next call,
+#    "reset": true if the watermark is too old to know all deletions (then should reload the gallery)
+# }
+
+# the next watermark is a few seconds behind now, so that saves still being committed
+# are not skipped (at the cost of reporting some changes twice)
+CHANGES_WATERMARK_MARGIN = timedelta(seconds=5)
+
+
+def getItemChanges(request):
+    now = timezone.now()
+    response = {
+        "items": [],
+        "removed": [],
+        "since": encodeWatermark(now - CHANGES_WATERMARK_MARGIN),
+        "reset": False,
+    }
+
+    if "since" not in request.GET:
+        return JsonResponse(response)
+
+    since = decodeWatermark(request.GET["since"])
+    if since is None:
+        return HttpResponse(status=400)
+
+    if since < now - settings.TOMBSTONE_RETENTION:
+        response["reset"] = True
+        return JsonResponse(response)
+
+    fields = parseCardFields(request, ITEM_CARD_FIELDS)
+    if fields is None:
+        return HttpResponse(status=400)
+
+    changed = list(itemCardQuerySet(Item.objects.filter(updated_at__gt=since), fields, ["status"]))
+    available = [item for item in changed if item.status == Item.AVAILABLE]
+    prefetchItemCardAlbums(available, fields)
+
+    response["items"] = [itemCard(item, fields) for item in available]
+    response["removed"] = [item.pk for item in changed if item.status != Item.AVAILABLE]
+    response["removed"] += list(
+        ItemTombstone.objects.filter(datetime__gt=since).values_list("item_pk", flat=True)
     )
+    return JsonResponse(response)
 
 
 # ----------------------------------------------------------------------
@@ -833,6 +1133,8 @@ def deleteItem(request, pk):
 # item page
 
 
+@cache_control(private=True, no_cache=True)
+@etag(itemPageETag)
 def pageItem(request, pk):
     try:
         item = Item.objects.get(pk=pk)
@@ -1512,6 +1814,8 @@ def deleteItemRequest(request, pk):
 # item_request page
 
 
+@cache_control(private=True, no_cache=True)
+@etag(itemRequestPageETag)
 def pageItemRequest(request, pk):
     try:
         item_request = ItemRequest.objects.get(pk=pk)
@@ -1531,15 +1835,99 @@ def browseItemRequests(request):
     return render(request, "marketplace/browse_item_requests.html", {})
 
 
+# ----------------------------------------------------------------------
+
+# item request "card" projection: the item request data shown by the item request gallery, as JSON
+# (loaded in one query together with the requester's contact/email if requested, like item cards)
+
+ITEM_REQUEST_CARD_FIELDS = {
+    "name": ["name"],
+    "posted_date": ["posted_date"],
+    "deadline": ["deadline"],
+    "price": ["price"],
+    "negotiable": ["negotiable"],
+    "condition_index": ["condition"],
+    "description": ["description"],
+    "image": ["image"],
+    "contact": ["requester__contact"],
+    "email": ["requester__email"],
+}
+
+ITEM_REQUEST_CARD_VALUES = {
+    "name": lambda item_request: item_request.name,
+    "posted_date": lambda item_request: item_request.posted_date.astimezone().strftime("%b. %-d, %Y, %-I:%M %p") + " ET",
+    "deadline": lambda item_request: item_request.deadline.strftime("%b. %-d, %Y"),
+    "price": lambda item_request: item_request.price,
+    "negotiable": lambda item_request: item_request.negotiable,
+    "condition_index": lambda item_request: str(item_request.condition),
+    "description": lambda item_request: item_request.description,
+    "image": lambda item_request: item_request.image.url,
+    "contact": lambda item_request: item_request.requester.contact,
+    "email": lambda item_request: item_request.requester.email,
+}
+
+
+def itemRequestCardQuerySet(item_requests, fields=ITEM_REQUEST_CARD_FIELDS, extra_fields=()):
+    only = ["pk", *extra_fields]
+    for field in fields:
+        only += ITEM_REQUEST_CARD_FIELDS[field]
+    if "contact" in fields or "email" in fields:
+        item_requests = item_requests.select_related("requester")
+        only.append("requester")
+    return item_requests.only(*only)
+
+
+def itemRequestCard(item_request, fields=ITEM_REQUEST_CARD_FIELDS):
+    card = {"pk": item_request.pk}
+    for field in fields:
+        card[field] = ITEM_REQUEST_CARD_VALUES[field](item_request)
+    return card
+
+
+ITEM_REQUEST_CARD_COMPACT_VALUES = {
+    "posted_date": lambda item_request: item_request.posted_date,
+    "deadline": lambda item_request: item_request.deadline,
+    "condition_index": lambda item_request: item_request.condition,
+}
+
+
+def itemRequestCardRow(item_request, fields=ITEM_REQUEST_CARD_FIELDS):
+    return [item_request.pk] + [
+        ITEM_REQUEST_CARD_COMPACT_VALUES.get(field, ITEM_REQUEST_CARD_VALUES[field])(item_request) for field in fields
+    ]
+
+
+# ----------------------------------------------------------------------
+
+# get the card of one item request (see getItemCard)
+# [OPTIONAL] fields ("field,field,..." of the card fields, see ITEM_REQUEST_CARD_FIELDS; all if not given)
+
+
+@cache_control(no_cache=True)
+@etag(itemRequestCardETag)
+def getItemRequestCard(request, pk):
+    fields = parseCardFields(request, ITEM_REQUEST_CARD_FIELDS)
+    if fields is None:
+        return HttpResponse(status=400)
+
+    item_request = itemRequestCardQuerySet(ItemRequest.objects.filter(pk=pk), fields).first()
+    if item_request is None:
+        return HttpResponse(status=400)
+
+    return JsonResponse(itemRequestCard(item_request, fields))
+
+
 # ----------------------------------------------------------------------
 
 # get item requests for image gallery with the following relative GET options:
 # [REQUIRED] count >= 1 (if n < count item requests fit the criteria, then only those n item requests returned)      
 # [REQUIRED] direction (forward/backward)
-# [REQUIRED] base_item_request_pk (if -1, then will collect item requests from beginning/end based on direction)
+# [REQUIRED] cursor (next_cursor of a previous response) or base_item_request_pk (if -1, then will collect item requests from beginning/end based on direction)
 # [OPTIONAL] search_string (used to index the item requests by name and description prior to retrieval)
 # [OPTIONAL] condition_indexes ("condition_index,condition_index,...")
 # [OPTIONAL] category_pks ("category_pk,category_pk,...")
+# [OPTIONAL] search_mode ("" for plain full text search, or "fuzzy" to also match word prefixes and typos)
+# [OPTIONAL] fields ("field,field,..." of the card fields to return, see ITEM_REQUEST_CARD_FIELDS; all if not given)
 
 # if base_item_request_pk == -1 and no item requests yet exist, then returns empty list
 
@@ -1569,129 +1957,219 @@ def browseItemRequests(request):
 #           "image", (url)
 #        },
 #        ...
-#    ]
+#    ],
+#    "next_cursor", (resumes after the last item request, with the same query options)
 # }
 
 
+@cache_control(no_cache=True)
+@etag(itemRequestsFeedETag)
 def getItemRequestsRelative(request):
     try:
         count = int(request.GET['count'])
         direction = request.GET['direction']
-        base_item_request_pk = int(request.GET['base_item_request_pk'])
+        base_item_request_pk = int(request.GET.get('base_item_request_pk', -1))
     except:
         return HttpResponse(status=400)
 
-    if count < 1 or base_item_request_pk < -1 or (base_item_request_pk != -1 and not ItemRequest.objects.filter(pk=base_item_request_pk).exists()) or direction not in ['forward', 'backward']:
+    if count < 1 or base_item_request_pk < -1 or direction not in ['forward', 'backward']:
         return HttpResponse(status=400)
 
-    search_string = ""
-    condition_indexes = []
-    categories = []
-    sort_type = ""
+    query = parseListingQuery(request)
+    fields = parseCardFields(request, ITEM_REQUEST_CARD_FIELDS)
+    if query is None or fields is None:
+        return HttpResponse(status=400)
 
-    if "search_string" in request.GET:
-        search_string = request.GET["search_string"]
+    # compact encodings (see encoding.py) are opted into with the Accept header
+    encoding = feedEncoding(request)
+    compact = isCompact(encoding)
 
-    if "condition_indexes" in request.GET:
-        try:
-            condition_indexes = [int(pk) for pk in request.GET["condition_indexes"].split(",") if pk]
-        except:
-            return HttpResponse(status=400)
+    # serve repeated identical queries (e.g. many galleries polling the same search) from the listing cache
+    result = cachedListing(
+        "item_requests",
+        [count, direction, base_item_request_pk, request.GET.get("cursor"), fields, compact, *query],
+        lambda: queryItemRequestsRelative(count, direction, base_item_request_pk, request.GET.get("cursor"), fields, compact, *query),
+    )
+    if result is None:
+        return HttpResponse(status=400)
+    return feedResponse(encoding, result)
+
+
+# ----------------------------------------------------------------------
+
+# helper method to query item requests for getItemRequestsRelative (see above)
+# returns the JSON response data, or None if the cursor or base item request is invalid
 
-    if "category_pks" in request.GET:
-        try:
-            categories = Category.objects.filter(pk__in=[int(pk) for pk in request.GET["category_pks"].split(",") if pk])
-        except:
-            return HttpResponse(status=400)
 
+def queryItemRequestsRelative(count, direction, base_item_request_pk, cursor, fields, compact, search_string, condition_indexes, category_pks, sort_type, search_mode):
     # filter item requests that meet conditions and categories criteria
     item_requests = ItemRequest.objects.all()
 
     if condition_indexes:
         item_requests = item_requests.filter(condition__in=condition_indexes)
 
-    if categories:
-        item_requests = item_requests.filter(categories__in=categories)
-        item_requests = ItemRequest.objects.filter(pk__in=item_requests) # get rid of duplicate rows (can happen because of filtering on m2m categories table)
+    if category_pks:
+        item_requests = item_requests.filter(category_pks__overlap=category_pks) # in any of the categories (denormalized, so no m2m join or duplicate rows)
 
-    # sort items by price or date if requested
-    order_by = ""
-    if "sort_type" in request.GET:
-        sort_type = request.GET["sort_type"]
+    # sort item requests by price or date if requested
+    if sort_type in SORT_ORDERINGS:
+        ordering = SORT_ORDERINGS[sort_type]
 
-        # items = sortMyItems(sort_type, items)
-
-        if sort_type == "price_hightolow":
-            order_by = [F("price").asc(), F("pk").asc()]
-        elif sort_type == "price_lowtohigh":
-            order_by=[F("price").desc(), F("pk").asc()]
-        elif sort_type == "date_oldtorec":
-            order_by=[F("posted_date").desc(), F("pk").asc()]
-        elif sort_type == "date_rectoold":
-            order_by=[F("posted_date").asc(), F("pk").asc()]
-
-    if order_by != "":
-        item_requests = item_requests.annotate(
-            row=Window(
-                expression=RowNumber(),
-                order_by=order_by, 
-            )
-        )
-
-    # default sort
+    # default sort by search string rank (see the search backends in search.py)
+    # (with no search string every rank is equal, so the pk alone gives the same order)
+    elif search_string:
+        ordering = RANK_ORDERING
     else:
-        # annotate items by search string rank
-        item_requests = item_requests.annotate(rank=SearchRank(SearchVector("name", "description"), SearchQuery(search_string), cover_density=True))
-
-        # annotate items by row number after sorting by search string rank (so no comparison issues with equal ranks)
-        item_requests = item_requests.annotate(
-            row=Window(
-                expression=RowNumber(),
-                order_by=[F("rank").asc(), F("pk").asc()], # also order by unique pk to make tie-breaks consistent
-            )
-        )
+        ordering = [("pk", True)]
+
+    # find the sort position to resume from (carried by the cursor, else that of the base item request),
+    # then get the correct slice of item requests after it
+    position = None
+    if cursor is not None:
+        position = decodeCursor(cursor, ordering)
+        if position is None:
+            return None
+    elif base_item_request_pk != -1:
+        if ordering == RANK_ORDERING:
+            position = searchBackend().rankPosition(ItemRequest.objects.all(), base_item_request_pk, search_string, search_mode)
+        else:
+            position = keysetPosition(ItemRequest.objects.all(), ordering, base_item_request_pk)
+        if position is None:
+            return None
 
-    # get the correct slice of item requests
-    if base_item_request_pk == -1:
-        item_requests = item_requests.order_by('row' if direction == 'forward' else '-row')[:count]
+    # load only the requested card fields (and the sort fields, for the next cursor)
+    item_requests = itemRequestCardQuerySet(
+        item_requests, fields, [field for field, ascending in ordering if field not in ["pk", "rank"]]
+    )
+    if ordering == RANK_ORDERING:
+        item_requests = searchBackend().rankedPage(item_requests, search_string, search_mode, position, direction, count)
     else:
-        # filter out item requests based on base_item_request
-        sign = ">" if direction == "forward" else "<"
-        order = "ASC" if direction == "forward" else "DESC"
-
-        # django does not allow filtering after window function, so will use raw SQL
-        sql, params = item_requests.query.sql_with_params()
-        item_requests = ItemRequest.objects.raw("""
-                SELECT * FROM ({}) AS item_requests_with_rows
-                WHERE row {} (
-                    SELECT row FROM ({}) AS base_item_request_row
-                    WHERE id = %s
-                )
-                ORDER BY row {}
-                LIMIT %s
-            """.format(sql, sign, sql, order), # must order results here, since cannot order RawQuerySet
-            [*params, *params, base_item_request_pk, count],
-        )
-
-    return JsonResponse(
-        {
-            "item_requests": [
-                {
-                    "pk": item_request.pk,
-                    "name": item_request.name,
-                    "posted_date": item_request.posted_date.astimezone().strftime("%b. %-d, %Y, %-I:%M %p") + " ET",
-                    "deadline": item_request.deadline.strftime("%b. %-d, %Y"),
-                    "price": item_request.price,
-                    "negotiable": item_request.negotiable,
-                    "condition_index": item_request.condition,
-                    "description": item_request.description,
-                    "image": item_request.image.url,
-                    "contact": item_request.requester.contact,
-                    "email": item_request.requester.email,
-                } for item_request in item_requests
-            ]
+        item_requests = list(keysetPage(item_requests, ordering, position, direction, count))
+
+    if compact:
+        return {
+            "item_requests": columns(
+                ["pk", *fields], [itemRequestCardRow(item_request, fields) for item_request in item_requests]
+            ),
+            "next_cursor": nextCursor(ordering, item_requests, position),
         }
+    return {
+        "item_requests": [itemRequestCard(item_request, fields) for item_request in item_requests],
+        "next_cursor": nextCursor(ordering, item_requests, position),
+    }
+
+
+# ----------------------------------------------------------------------
+
+# search the available items and the item requests at once, with the following relative GET options:
+# [REQUIRED] count >= 1
+# [REQUIRED] direction (forward/backward)
+# [REQUIRED] search_string
+# [OPTIONAL] cursor (next_cursor of a previous response; if not given, starts from the beginning/end based on direction)
+# [OPTIONAL] search_mode ("" for plain full text search, or "fuzzy" to also match word prefixes and typos)
+# [OPTIONAL] fields ("field,field,..." of the card fields of either type, see ITEM_CARD_FIELDS
+#            and ITEM_REQUEST_CARD_FIELDS; all if not given)
+
+# only the matching items and item requests are returned, sorted by search rank
+# (as getItemsRelative, so the best matches come first going backward), merged
+# by the search backend (see searchPage in search.py)
+
+# returns:
+# {
+#    "results": [
+#        {
+#           "type", ("item" or "item_request")
+#           "pk",
+#           ... (the card fields of that type)
+#        },
+#        ...
+#    ],
+#    "next_cursor", (resumes after the last result, with the same query options)
+# }
+
+SEARCH_RESULT_TYPES = ["item", "item_request"]
+
+
+@cache_control(no_cache=True)
+@etag(searchFeedETag)
+def getSearchResults(request):
+    try:
+        count = int(request.GET['count'])
+        direction = request.GET['direction']
+        search_string = request.GET['search_string']
+    except:
+        return HttpResponse(status=400)
+
+    search_mode = request.GET.get("search_mode", "")
+    if count < 1 or direction not in ['forward', 'backward'] or search_mode not in SEARCH_MODES:
+        return HttpResponse(status=400)
+
+    # the requested fields of each type (a field of the other type only is ignored)
+    item_fields = list(ITEM_CARD_FIELDS)
+    item_request_fields = list(ITEM_REQUEST_CARD_FIELDS)
+    if "fields" in request.GET:
+        fields = [field for field in request.GET["fields"].split(",") if field]
+        if any(field not in ITEM_CARD_FIELDS and field not in ITEM_REQUEST_CARD_FIELDS for field in fields):
+            return HttpResponse(status=400)
+        item_fields = [field for field in ITEM_CARD_FIELDS if field in fields]
+        item_request_fields = [field for field in ITEM_REQUEST_CARD_FIELDS if field in fields]
+
+    search_string, condition_indexes, category_pks, sort_type, search_mode = normalizeListingQuery(
+        search_string, [], [], "", search_mode
     )
+    result = cachedListing(
+        "search",
+        [count, direction, request.GET.get("cursor"), item_fields, item_request_fields, search_string, search_mode],
+        lambda: querySearchResults(
+            count, direction, request.GET.get("cursor"), item_fields, item_request_fields, search_string, search_mode
+        ),
+    )
+    if result is None:
+        return HttpResponse(status=400)
+    return JsonResponse(result)
+
+
+# helper method to query the results for getSearchResults (see above)
+# returns the JSON response data, or None if the cursor is invalid
+
+
+def querySearchResults(count, direction, cursor, item_fields, item_request_fields, search_string, search_mode):
+    position = None
+    if cursor is not None:
+        position = decodeCursor(cursor, SEARCH_ORDERING)
+        if position is None:
+            return None
+
+    # rank the matching rows of both types, then load the cards of the page (1 query per type)
+    keys = searchBackend().searchPage(
+        [Item.objects.filter(status=Item.AVAILABLE), ItemRequest.objects.all()],
+        search_string,
+        search_mode,
+        position,
+        direction,
+        count,
+    )
+    items = itemCardQuerySet(
+        Item.objects.filter(pk__in=[pk for rank, kind, pk in keys if kind == 0]), item_fields
+    ).in_bulk()
+    prefetchItemCardAlbums(list(items.values()), item_fields)
+    item_requests = itemRequestCardQuerySet(
+        ItemRequest.objects.filter(pk__in=[pk for rank, kind, pk in keys if kind == 1]), item_request_fields
+    ).in_bulk()
+
+    results = []
+    for rank, kind, pk in keys:
+        if kind == 0 and pk in items:
+            results.append({"type": SEARCH_RESULT_TYPES[kind], **itemCard(items[pk], item_fields)})
+        elif kind == 1 and pk in item_requests:
+            results.append({"type": SEARCH_RESULT_TYPES[kind], **itemRequestCard(item_requests[pk], item_request_fields)})
+
+    if keys:
+        position = list(keys[-1])
+    return {
+        "results": results,
+        "next_cursor": encodeCursor(SEARCH_ORDERING, position) if position is not None else None,
+    }
 
 
 # ----------------------------------------------------------------------
@@ -1703,7 +2181,7 @@ def getItemRequestsRelative(request):
 def listNotifications(request):
     account = Account.objects.get(username=request.session.get("username"))
     notifications = account.notifications.all().order_by("-datetime")
-    context = {"notifications": notifications}
+    context = {"notifications": notifications, "seen_through": account.notifications_seen_through}
     return render(request, "marketplace/list_notifications.html", context)
 
 
@@ -1714,14 +2192,16 @@ def listNotifications(request):
 
 @authentication_required
 def countNotifications(request):
-    account = Account.objects.get(username=request.session.get("username"))
-    count = account.notifications.filter(seen=False).count()
+    # read from the denormalized counter (see Account.unread_notifications), as every open tab polls this
+    count = Account.objects.filter(username=request.session.get("username")).values_list(
+        "unread_notifications", flat=True
+    ).first()
     return JsonResponse({"count": count})
 
 
 # ----------------------------------------------------------------------
 
-# sees notifications in GET param "notifications=pk,pk,..."
+# sees notifications up to GET param "through=pk" (the most recent notification retrieved)
 # otherwise, see all notifications
 
 
@@ -1729,13 +2209,35 @@ def countNotifications(request):
 def seeNotifications(request):
     account = Account.objects.get(username=request.session.get("username"))
 
-    if "notifications" in request.GET:
-        notification_pks = [int(pk) for pk in request.GET["notifications"].split(",") if pk]
-        notifications = account.notifications.filter(pk__in=notification_pks)
+    if "through" in request.GET:
+        try:
+            through = int(request.GET["through"])
+        except ValueError:
+            return HttpResponse(status=400)
     else:
-        notifications = account.notifications.all()
-
-    notifications.update(seen=True)
+        through = account.notifications.aggregate(through=Max("pk"))["through"]
+        if through is None:
+            return HttpResponse(status=200)
+
+    # move the watermark forward to a notification of the account, and take the
+    # newly seen ones off the unread counter, in one update
+    newly_seen = (
+        Notification.objects.filter(
+            account=OuterRef("pk"), pk__gt=OuterRef("notifications_seen_through"), pk__lte=through
+        )
+        .order_by()
+        .values("account")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Account.objects.filter(
+        Exists(Notification.objects.filter(account=OuterRef("pk"), pk=through)),
+        pk=account.pk,
+        notifications_seen_through__lt=through,
+    ).update(
+        notifications_seen_through=through,
+        unread_notifications=F("unread_notifications") - Subquery(newly_seen),
+    )
     return HttpResponse(status=200)
 
 
@@ -1750,9 +2252,10 @@ def getNotifications(request):
     notifications = account.notifications.all().order_by("-datetime")
     return JsonResponse(
         {
-            "notifications": list(
-                notifications.values_list("datetime", "text", "seen", "url")
-            )
+            "notifications": [
+                (notification_datetime, text, pk <= account.notifications_seen_through, url)
+                for pk, notification_datetime, text, url in notifications.values_list("pk", "datetime", "text", "url")
+            ]
         }
     )
 
@@ -1762,7 +2265,7 @@ def getNotifications(request):
 # get notifications with the following relative GET options:
 # count >= 1 (if n < count notifications fit the criteria, then only those n notifications returned)      
 # direction (forward/backward)
-# base_notification_pk (if -1, then will collect notifications from beginning/end based on direction)
+# cursor (next_cursor of a previous response) or base_notification_pk (if -1, then will collect notifications from beginning/end based on direction)
 
 # if base_notification_pk == -1 and no notifications yet exist, then returns empty list
 
@@ -1771,8 +2274,16 @@ def getNotifications(request):
 # returns:
 # {
 #    "notifications": [["pk", "datetime", "text", "seen", "url"], ["pk", "datetime", "text", "seen", "url"], ]
+#    "next_cursor": resumes after the last notification returned
+# }
+# or with a compact encoding (see encoding.py):
+# {
+#    "notifications": {"pk": [...], "datetime": [epoch milliseconds, ...], "text": [...], "seen": [...], "url": [...]},
+#    "next_cursor": resumes after the last notification returned
 # }
 
+NOTIFICATION_ORDERING = [("datetime", True), ("pk", True)]
+
 
 @authentication_required
 def getNotificationsRelative(request):
@@ -1780,54 +2291,100 @@ def getNotificationsRelative(request):
     try:
         count = int(request.GET['count'])
         direction = request.GET['direction']
-        base_notification_pk = int(request.GET['base_notification_pk'])
+        base_notification_pk = int(request.GET.get('base_notification_pk', -1))
     except:
         return HttpResponse(status=400)
 
-    if count < 1 or base_notification_pk < -1 or (base_notification_pk != -1 and not account.notifications.filter(pk=base_notification_pk).exists()) or direction not in ['forward', 'backward']:
+    if count < 1 or base_notification_pk < -1 or direction not in ['forward', 'backward']:
         return HttpResponse(status=400)
 
-    # annotate notifications by row number after sorting by datetime (so no comparison issues with equal datetimes)
-    notifications = account.notifications.annotate(
-        row=Window(
-            expression=RowNumber(),
-            order_by=[F("datetime").asc(), F("pk").asc()], # also order by unique pk to make tie-breaks consistent
-        )
-    )
+    # notifications are sorted by datetime (and by unique pk to make tie-breaks consistent)
+    ordering = NOTIFICATION_ORDERING
+
+    # find the sort position to resume from (carried by the cursor, else that of the base notification)
+    position = None
+    if "cursor" in request.GET:
+        position = decodeCursor(request.GET["cursor"], ordering)
+        if position is None:
+            return HttpResponse(status=400)
+    elif base_notification_pk != -1:
+        position = keysetPosition(account.notifications.all(), ordering, base_notification_pk)
+        if position is None:
+            return HttpResponse(status=400)
+
     # retrieve the notifications to return
-    if base_notification_pk == -1:
-        notifications = notifications.order_by('row' if direction == 'forward' else '-row')[:count]
-    else:
-        # filter out notifications based on base_notification
-        sign = ">" if direction == "forward" else "<"
-        order = "ASC" if direction == "forward" else "DESC"
-
-        # django does not allow filtering after window function, so will use raw SQL
-        sql, params = notifications.query.sql_with_params()
-        notifications = account.notifications.raw("""
-                SELECT * FROM ({}) AS notifications_with_rows
-                WHERE row {} (
-                    SELECT row FROM ({}) AS base_notification_row
-                    WHERE id = %s
-                )
-                ORDER BY row {}
-                LIMIT %s
-            """.format(sql, sign, sql, order), # must order results here, since cannot order RawQuerySet
-            [*params, *params, base_notification_pk, count],
-        )
+    notifications = list(keysetPage(account.notifications.all(), ordering, position, direction, count))
 
-    return JsonResponse(
+    encoding = feedEncoding(request)
+    return feedResponse(
+        encoding,
         {
-            "notifications": [
-                [
-                    notification.pk, 
-                    notification.datetime, 
-                    notification.text, 
-                    notification.seen, 
-                    notification.url
-                ] for notification in notifications
-            ]
-        }
+            "notifications": notificationRows(encoding, notifications, account.notifications_seen_through),
+            "next_cursor": nextCursor(ordering, notifications, position),
+        },
+    )
+
+
+# notifications as rows ["pk", "datetime", "text", "seen", "url"], or as columns with a compact encoding
+# (seen up to the watermark seen_through of their account)
+
+
+def notificationRows(encoding, notifications, seen_through):
+    rows = [
+        [
+            notification.pk,
+            notification.datetime,
+            notification.text,
+            notification.pk <= seen_through,
+            notification.url,
+        ]
+        for notification in notifications
+    ]
+    if isCompact(encoding):
+        return columns(["pk", "datetime", "text", "seen", "url"], rows)
+    return rows
+
+
+# ----------------------------------------------------------------------
+
+# everything a page needs to show the notifications menu, in one request:
+# count >= 1 (number of most recent notifications to return)
+
+# returns (with the notifications encoded as in getNotificationsRelative):
+# {
+#    "count": number of unseen notifications
+#    "notifications": the count most recent notifications, most recent first
+#    "next_cursor": resumes getNotificationsRelative backward after the last notification returned
+# }
+
+# the account (with its denormalized unread count) and the notifications each
+# take one indexed query (see Notification.Meta)
+
+
+@authentication_required
+def bootstrapNotifications(request):
+    try:
+        count = int(request.GET['count'])
+    except:
+        return HttpResponse(status=400)
+
+    if count < 1:
+        return HttpResponse(status=400)
+
+    account_pk, unread_notifications, seen_through = Account.objects.filter(
+        username=request.session.get("username")
+    ).values_list("pk", "unread_notifications", "notifications_seen_through").get()
+    ordering = NOTIFICATION_ORDERING
+    notifications = list(keysetPage(Notification.objects.filter(account=account_pk), ordering, None, "backward", count))
+
+    encoding = feedEncoding(request)
+    return feedResponse(
+        encoding,
+        {
+            "count": unread_notifications,
+            "notifications": notificationRows(encoding, notifications, seen_through),
+            "next_cursor": nextCursor(ordering, notifications, None),
+        },
     )
 
 
@@ -1858,7 +2415,7 @@ def getMessages(request, pk):
 # get messages sent to and received from account pk with the following relative GET options:
 # count >= 1 (if n < count messages fit the criteria, then only those n messages returned)      
 # direction (forward/backward)
-# base_message_pk (if -1, then will collect messages from beginning/end based on direction)
+# cursor (next_cursor of a previous response) or base_message_pk (if -1, then will collect messages from beginning/end based on direction)
 
 # if base_message_pk == -1 and no messages yet exist, then returns empty list
 
@@ -1867,8 +2424,11 @@ def getMessages(request, pk):
 #    "sent":     [["pk", "datetime", "text"], ["pk", "datetime", "text"], ]
 #    "received": [["pk", "datetime", "text"], ["pk", "datetime", "text"], ]
 #    "last_message_pk": pk or -1 if no messages returned
+#    "next_cursor": resumes after the last message returned
 # }
 
+MESSAGE_ORDERING = [("datetime", True), ("pk", True)]
+
 
 @authentication_required
 def getMessagesRelative(request, pk):
@@ -1877,54 +2437,41 @@ def getMessagesRelative(request, pk):
         contact = Account.objects.get(pk=pk)
         count = int(request.GET['count'])
         direction = request.GET['direction']
-        base_message_pk = int(request.GET['base_message_pk'])
+        base_message_pk = int(request.GET.get('base_message_pk', -1))
     except:
         return HttpResponse(status=400)
 
-    if count < 1 or base_message_pk < -1 or (base_message_pk != -1 and (not account.sent_messages.filter(pk=base_message_pk, receiver=contact).exists()) and (not account.received_messages.filter(pk=base_message_pk, sender=contact).exists())) or direction not in ['forward', 'backward']:
+    if count < 1 or base_message_pk < -1 or direction not in ['forward', 'backward']:
         return HttpResponse(status=400)
 
     # filter only messages between account and contact
     messages = Message.objects.filter((Q(sender=account) & Q(receiver=contact)) | (Q(sender=contact) & Q(receiver=account)))
 
-    # annotate messages by row number after sorting by datetime (so no comparison issues with equal datetimes)
-    messages = messages.annotate(
-        row=Window(
-            expression=RowNumber(),
-            order_by=[F("datetime").asc(), F("pk").asc()], # also order by unique pk to make tie-breaks consistent
-        )
-    )
+    # messages are sorted by datetime (and by unique pk to make tie-breaks consistent)
+    ordering = MESSAGE_ORDERING
+
+    # find the sort position to resume from (carried by the cursor, else that of the base message)
+    position = None
+    if "cursor" in request.GET:
+        position = decodeCursor(request.GET["cursor"], ordering)
+        if position is None:
+            return HttpResponse(status=400)
+    elif base_message_pk != -1:
+        position = keysetPosition(messages, ordering, base_message_pk)
+        if position is None:
+            return HttpResponse(status=400)
 
     # get the correct slice of messages
-    if base_message_pk == -1:
-        messages = messages.order_by('row' if direction == 'forward' else '-row')[:count]
-    else:
-        # filter out messages based on base_message
-        sign = ">" if direction == "forward" else "<"
-        order = "ASC" if direction == "forward" else "DESC"
-
-        # django does not allow filtering after window function, so will use raw SQL
-        sql, params = messages.query.sql_with_params()
-        messages = Message.objects.raw("""
-                SELECT * FROM ({}) AS messages_with_rows
-                WHERE row {} (
-                    SELECT row FROM ({}) AS base_message_row
-                    WHERE id = %s
-                )
-                ORDER BY row {}
-                LIMIT %s
-            """.format(sql, sign, sql, order), # must order results here, since cannot order RawQuerySet
-            [*params, *params, base_message_pk, count],
-        )
+    messages = list(keysetPage(messages, ordering, position, direction, count))
 
     # separate into sent and received lists
     sent = []
     received = []
     last_message_pk = -1
     for message in messages:
-        if message.sender == account:
+        if message.sender_id == account.pk:
             sent.append([message.pk, message.datetime, message.text])
-        if message.receiver == account:
+        if message.receiver_id == account.pk:
             received.append([message.pk, message.datetime, message.text])
         last_message_pk = message.pk
     return JsonResponse(
@@ -1932,6 +2479,7 @@ def getMessagesRelative(request, pk):
             "sent": sent,
             "received": received,
             "last_message_pk": last_message_pk,
+            "next_cursor": nextCursor(ordering, messages, position),
         }
     )
 
@@ -2354,6 +2902,14 @@ def deleteExpired():
         # delete the item request
         item_request.delete()
 
+    # forget deleted items and item requests after the tombstone retention
+    ItemTombstone.objects.filter(
+        datetime__lt=timezone.now() - settings.TOMBSTONE_RETENTION
+    ).delete()
+    ItemRequestTombstone.objects.filter(
+        datetime__lt=timezone.now() - settings.TOMBSTONE_RETENTION
+    ).delete()
+
 
 # ----------------------------------------------------------------------
 # messaging system page